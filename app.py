@@ -1,22 +1,60 @@
 ﻿import os
+import asyncio
+import bisect
+import contextvars
 import csv
+import logging
+import gzip
 import io
+import json
+import queue
+import random
+import re
+import shutil
 import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
 import uuid
+import zlib
+from array import array
 from pathlib import Path
-from datetime import datetime
+from urllib.parse import parse_qs, urlencode
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from typing import Optional
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from collections import Counter, OrderedDict, deque
+from logging.handlers import RotatingFileHandler
 
 from fastapi import FastAPI, Request, Form, UploadFile, File
-from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.routing import Match
+from starlette.staticfiles import NotModifiedResponse
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache, Template
+from markupsafe import Markup
 import bcrypt
 import hashlib
 from itsdangerous import URLSafeSerializer, BadSignature
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.sessions import SessionMiddleware
 
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # variants are skipped and the originals served as-is
+    Image = ImageOps = None
+
+try:
+    import orjson
+except ImportError:  # the API falls back to the stdlib encoder
+    orjson = None
+
 APP_NAME = "Bank Al-Isra"
 BASE_DIR = Path(__file__).resolve().parent
 # IMPORTANT: Change this SECRET_KEY in production
@@ -25,26 +63,754 @@ SESSION_COOKIE = "session"
 DB_PATH = str(BASE_DIR / "app.db")
 UPLOAD_DIR = BASE_DIR / "static" / "uploads"
 ALLOWED_IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".jfif"}
+UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 256 * 1024
+IMAGE_VARIANTS = {"display": 1280, "thumb": 320}
+IMAGE_VARIANT_QUALITY = 80
+STATIC_MAX_AGE = 365 * 24 * 3600
+TEMPLATE_CACHE_DIR = BASE_DIR / ".jinja_cache"
+PACK_DIR = BASE_DIR / "static" / "packs"
+FRAGMENT_CACHE_SIZE = 5000
+FRAGMENT_CACHE_TTL = 3600
+PAGE_CACHE_SIZE = 2000
+PAGE_CACHE_TTL = 300
+# Upper bounds (seconds) of the request latency histogram buckets
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Statements slower than this are logged with their query plan (0 turns it off)
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_SECONDS = SLOW_QUERY_MS / 1000 if SLOW_QUERY_MS > 0 else float("inf")
+SLOW_QUERY_LOG = Path(os.environ.get("SLOW_QUERY_LOG", BASE_DIR / "logs" / "slow_queries.log"))
+SLOW_QUERY_LOG_BYTES = 2 * 1024 * 1024
+SLOW_QUERY_LOG_BACKUPS = 3
+SLOW_QUERY_RECENT = 50
+# SQLite tuning (connections are pooled, so these are applied once per connection)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_READ_POOL_SIZE = int(os.environ.get("DB_READ_POOL_SIZE", "4"))
+DB_POOL_TIMEOUT = 30
+DB_BUSY_TIMEOUT_MS = 5000
+DB_CACHE_SIZE = -16000  # negative = KiB, i.e. ~16 MB page cache per connection
+DB_MMAP_SIZE = 256 * 1024 * 1024
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60
+NAV_INDEX_TTL = 600
+LEADERBOARD_TTL = 600
+LEADERBOARD_PAGE_SIZE = 50
+EXAM_DEFAULT_QUESTIONS = 20
+EXAM_MAX_QUESTIONS = 100
+EXAM_SECONDS_PER_QUESTION = 60
+EXAM_GRACE_SECONDS = 30
+ADMIN_PAGE_SIZE = 50
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+EXPORT_BATCH_SIZE = 500
+IMPORT_BATCH_SIZE = 100
+IMPORT_INLINE_BYTES = 1024 * 1024
+IMPORT_MAX_ERRORS = 50
+IMPORT_JOBS_KEPT = 20
+# Near-duplicate detection: MinHash over character shingles, banded for LSH
+MINHASH_SHINGLE = 4
+MINHASH_SLOTS = 64
+MINHASH_BANDS = 16
+NEAR_DUPLICATE_THRESHOLD = 0.7
+NEAR_DUPLICATE_CANDIDATES = 50
+NEAR_DUPLICATE_BUCKET_LIMIT = 200
+# Attempts older than this move to the archive database (0, the default, keeps
+# them all); the archive defaults to attempts_archive.db next to DB_PATH
+ATTEMPTS_RETENTION_DAYS = int(os.environ.get("ATTEMPTS_RETENTION_DAYS", "0"))
+ATTEMPTS_ARCHIVE_PATH = os.environ.get("ATTEMPTS_ARCHIVE_PATH", "")
+ATTEMPTS_ARCHIVE_INTERVAL = 6 * 3600
+ATTEMPTS_ARCHIVE_BATCH = 1000
+# Group commit: writes arriving within this window share one transaction/fsync
+WRITE_FLUSH_INTERVAL_MS = float(os.environ.get("WRITE_FLUSH_INTERVAL_MS", "2"))
+WRITE_BATCH_SIZE = int(os.environ.get("WRITE_BATCH_SIZE", "256"))
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    enable_template_cache()
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    _image_executor.submit(backfill_image_variants)
+    PACK_DIR.mkdir(parents=True, exist_ok=True)
+    db_writer.start(DB_PATH)
+    subject_packs.schedule_all()
+    archiver = asyncio.create_task(_archive_loop()) if ATTEMPTS_RETENTION_DAYS > 0 else None
     yield
+    if archiver:
+        archiver.cancel()
+    db_writer.stop()
+    close_pools()
+
+
+# ---------- Static assets ----------
+
+_fingerprints: dict = {}
+
+
+def asset_fingerprint(path: str) -> Optional[str]:
+    """Short content hash of a file under static/, recomputed when it changes."""
+    full = BASE_DIR / "static" / path
+    try:
+        st = full.stat()
+    except OSError:
+        return None
+    cached = _fingerprints.get(path)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    digest = hashlib.sha256(full.read_bytes()).hexdigest()[:12]
+    _fingerprints[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+def asset_url(path: str) -> str:
+    digest = asset_fingerprint(path)
+    return f"/static/{path}?v={digest}" if digest else f"/static/{path}"
+
+
+class AssetFiles(StaticFiles):
+    """StaticFiles with content ETags and far-future caching for immutable URLs.
+
+    Uploads never change once written, and asset_url() links and subject
+    packs carry the content hash, so all three are served as immutable.
+    Anything else has to be revalidated, which the ETag turns into a 304.
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        path = Path(self.get_path(scope)).as_posix()
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        if path.startswith(("uploads/", "packs/")):
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+            if path.endswith(".json.gz"):
+                response.headers["Content-Encoding"] = "gzip"
+        else:
+            digest = asset_fingerprint(path)
+            if digest:
+                response.headers["ETag"] = f'"{digest}"'
+            version = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v", [None])[0]
+            if digest and version == digest:
+                response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+            else:
+                response.headers["Cache-Control"] = "no-cache"
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
+
 
 app = FastAPI(lifespan=lifespan)
-app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
+app.mount("/static", AssetFiles(directory=BASE_DIR / "static"), name="static")
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
+templates.env.globals["asset_url"] = asset_url
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY, session_cookie="flash")
 
 
-def get_db():
-    conn = sqlite3.connect(DB_PATH)
+def enable_template_cache():
+    """Keep compiled templates in TEMPLATE_CACHE_DIR; without a writable one they compile in memory."""
+    try:
+        TEMPLATE_CACHE_DIR.mkdir(exist_ok=True)
+    except OSError:
+        return
+    if os.access(TEMPLATE_CACHE_DIR, os.W_OK):
+        templates.env.bytecode_cache = FileSystemBytecodeCache(str(TEMPLATE_CACHE_DIR))
+
+
+# ---------- Metrics ----------
+
+class RequestStats:
+    """SQL and template work done while serving one request."""
+
+    __slots__ = ("path", "sql_count", "sql_seconds", "render_seconds", "rendering")
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.rendering = False
+
+
+# Set by MetricsMiddleware; db_read() / db_write() carry it to their threads.
+_request_stats: contextvars.ContextVar = contextvars.ContextVar("request_stats", default=None)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that keeps timing its statement while rows are fetched.
+
+    execute() only prepares the statement and steps to the first row, so a
+    statement's time is the execute plus every fetch. It is logged once: when
+    iteration or fetchmany() runs out of rows, otherwise as soon as the total
+    passes SLOW_QUERY_MS.
+    """
+
+    def start(self, sql, parameters, stats):
+        self.sql, self.parameters, self.stats = sql, parameters, stats
+        self.seconds = 0.0
+        self.logged = False
+
+    def add(self, elapsed: float, finished: bool):
+        self.seconds += elapsed
+        if self.stats is not None:
+            self.stats.sql_seconds += elapsed
+        if finished and not self.logged and self.seconds >= SLOW_QUERY_SECONDS:
+            self.logged = True
+            record_slow_query(self.connection, self.sql, self.parameters, self.seconds, param_shape(self.parameters), self.stats)
+
+    def timed(self, fetch, *args, streaming=False):
+        start = time.perf_counter()
+        finished = not streaming
+        try:
+            rows = fetch(*args)
+            if streaming and args and len(rows) < args[0]:
+                finished = True
+            return rows
+        except StopIteration:
+            finished = True
+            raise
+        finally:
+            if hasattr(self, "sql"):
+                self.add(time.perf_counter() - start, finished)
+
+    def fetchone(self):
+        return self.timed(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self.timed(super().fetchmany, self.arraysize if size is None else size, streaming=True)
+
+    def fetchall(self):
+        return self.timed(super().fetchall)
+
+    def __next__(self):
+        return self.timed(super().__next__, streaming=True)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that counts and times statements for the current request.
+
+    Time includes fetching the rows (see InstrumentedCursor). Statements slower
+    than SLOW_QUERY_MS are also written to the slow-query log.
+    """
+
+    def execute(self, sql, parameters=()):
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.sql_count += 1
+        cursor = self.cursor(InstrumentedCursor)
+        cursor.start(sql, parameters, stats)
+        return cursor.timed(cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = _request_stats.get()
+            if stats is not None:
+                stats.sql_count += 1
+                stats.sql_seconds += elapsed
+            if elapsed >= SLOW_QUERY_SECONDS:
+                record_slow_query(self, sql, (None,) * sql.count("?"), elapsed, "executemany", stats)
+
+
+class TimedTemplate(Template):
+    """Adds render time to the current request; nested renders count once."""
+
+    def render(self, *args, **kwargs):
+        stats = _request_stats.get()
+        if stats is None or stats.rendering:
+            return super().render(*args, **kwargs)
+        stats.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            stats.render_seconds += time.perf_counter() - start
+            stats.rendering = False
+
+
+templates.env.template_class = TimedTemplate
+
+
+class RouteMetrics:
+    __slots__ = ("buckets", "count", "seconds", "sql_count", "sql_seconds", "render_seconds", "statuses")
+
+    def __init__(self):
+        self.buckets = [0] * (len(METRICS_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.statuses = {}
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """In-process per-route metrics, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            entry = self._routes.get((method, route))
+            if entry is None:
+                entry = self._routes[(method, route)] = RouteMetrics()
+            entry.buckets[bisect.bisect_left(METRICS_BUCKETS, seconds)] += 1
+            entry.count += 1
+            entry.seconds += seconds
+            entry.sql_count += stats.sql_count
+            entry.sql_seconds += stats.sql_seconds
+            entry.render_seconds += stats.render_seconds
+            entry.statuses[status] = entry.statuses.get(status, 0) + 1
+
+    def render(self) -> str:
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                "# HELP bank_http_request_duration_seconds Time to serve a request, including the response body.",
+                "# TYPE bank_http_request_duration_seconds histogram",
+            ]
+            for (method, route), m in routes:
+                labels = f'method="{method}",route="{_label(route)}"'
+                cumulative = 0
+                for bound, n in zip((*METRICS_BUCKETS, "+Inf"), m.buckets):
+                    cumulative += n
+                    lines.append(f'bank_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"bank_http_request_duration_seconds_sum{{{labels}}} {m.seconds:.6f}")
+                lines.append(f"bank_http_request_duration_seconds_count{{{labels}}} {m.count}")
+            lines += ["# HELP bank_http_requests_total Requests by response status.", "# TYPE bank_http_requests_total counter"]
+            for (method, route), m in routes:
+                for status, n in sorted(m.statuses.items()):
+                    lines.append(f'bank_http_requests_total{{method="{method}",route="{_label(route)}",status="{status}"}} {n}')
+            for name, attr, help_text in (
+                ("bank_sql_statements_total", "sql_count", "SQL statements executed while serving requests."),
+                ("bank_sql_seconds_total", "sql_seconds", "Time spent executing statements and fetching their rows while serving requests."),
+                ("bank_template_render_seconds_total", "render_seconds", "Time spent rendering templates while serving requests."),
+            ):
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+                for (method, route), m in routes:
+                    value = getattr(m, attr)
+                    lines.append(f'{name}{{method="{method}",route="{_label(route)}"}} {value if isinstance(value, int) else f"{value:.6f}"}')
+        caches = {name: cache.stats() for name, cache in CACHES.items()}
+        for name, key, kind in (
+            ("bank_cache_hits_total", "hits", "counter"),
+            ("bank_cache_misses_total", "misses", "counter"),
+            ("bank_cache_entries", "size", "gauge"),
+        ):
+            lines.append(f"# TYPE {name} {kind}")
+            lines += [f'{name}{{cache="{cache}"}} {stats[key]}' for cache, stats in caches.items()]
+        lines += [
+            "# TYPE bank_db_write_batches_total counter",
+            f"bank_db_write_batches_total {db_writer.batches}",
+            "# TYPE bank_db_write_jobs_total counter",
+            f"bank_db_write_jobs_total {db_writer.jobs}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _route_label(scope) -> str:
+    """Route template (``/questions/{question_id}``) so labels stay bounded."""
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # answered by the page cache, or by a mount (which has moved root_path)
+    scope = {**scope, "root_path": scope.get("app_root_path", scope.get("root_path", ""))}
+    for candidate in app.router.routes:
+        if candidate.matches(scope)[0] == Match.FULL:
+            return candidate.path
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Times every request and records its SQL and template work in ``metrics``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(scope["path"])
+        token = _request_stats.set(stats)
+        status = 500
+
+        async def send_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            _request_stats.reset(token)
+            metrics.observe(scope["method"], _route_label(scope), status, time.perf_counter() - start, stats)
+
+
+# ---------- Slow queries ----------
+
+_SQL_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SQL_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_PLAN_FULL_SCAN = re.compile(r"^SCAN (\w+)(?! USING (COVERING )?INDEX)( AS \w+)?$")
+
+slow_query_log = logging.getLogger("bank.slow_queries")
+slow_query_log.propagate = False
+_explained: dict = {}
+
+
+def normalize_sql(sql: str) -> str:
+    """One spelling per statement shape: literals and IN lists become ``?``."""
+    sql = _SQL_LITERAL.sub("?", " ".join(sql.split()))
+    return _SQL_IN_LIST.sub("(?, ...)", sql)
+
+
+def param_shape(parameters) -> str:
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    runs = []
+    for value in parameters:
+        name = type(value).__name__
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return "(" + ", ".join(name if n == 1 else f"{name} x{n}" for name, n in runs) + ")"
+
+
+def _explain(conn: sqlite3.Connection, sql: str, parameters) -> list:
+    try:
+        rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.Error:
+        return []
+    return [row[3] for row in rows]
+
+
+def record_slow_query(conn: sqlite3.Connection, sql: str, parameters, seconds: float, shape: str, stats):
+    """Append one slow statement (with its query plan) to SLOW_QUERY_LOG."""
+    if not slow_query_log.handlers:
+        SLOW_QUERY_LOG.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(SLOW_QUERY_LOG, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=SLOW_QUERY_LOG_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        slow_query_log.addHandler(handler)
+        slow_query_log.setLevel(logging.WARNING)
+    normalized = normalize_sql(sql)
+    fingerprint = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+    # the plan only depends on the statement shape, so explain it once
+    plan = _explained.get(fingerprint)
+    if plan is None:
+        plan = _explained[fingerprint] = _explain(conn, sql, parameters)
+    slow_query_log.warning(json.dumps({
+        "at": now_iso(),
+        "fingerprint": fingerprint,
+        "ms": round(seconds * 1000, 2),
+        "sql": normalized,
+        "params": shape,
+        "plan": plan,
+        "path": stats.path if stats is not None else None,
+    }, ensure_ascii=False))
+
+
+def slow_query_report(recent: int = SLOW_QUERY_RECENT) -> tuple:
+    """Aggregate the on-disk log: (statements by total time, latest entries)."""
+    files = [SLOW_QUERY_LOG.with_name(f"{SLOW_QUERY_LOG.name}.{i}") for i in range(SLOW_QUERY_LOG_BACKUPS, 0, -1)]
+    groups = {}
+    latest = deque(maxlen=recent)
+    for path in [*files, SLOW_QUERY_LOG]:
+        try:
+            lines = path.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            latest.append(entry)
+            group = groups.get(entry["fingerprint"])
+            if group is None:
+                scans = [m.group(1) for m in map(_PLAN_FULL_SCAN.match, entry["plan"]) if m]
+                group = groups[entry["fingerprint"]] = {
+                    "sql": entry["sql"], "plan": entry["plan"], "full_scans": scans,
+                    "count": 0, "total_ms": 0.0, "max_ms": 0.0, "paths": set(),
+                }
+            group["count"] += 1
+            group["total_ms"] += entry["ms"]
+            group["max_ms"] = max(group["max_ms"], entry["ms"])
+            group["last_at"] = entry["at"]
+            if entry.get("path"):
+                group["paths"].add(entry["path"])
+    ranked = sorted(groups.values(), key=lambda g: g["total_ms"], reverse=True)
+    return ranked, list(reversed(latest))
+
+
+# ---------- Database ----------
+
+def open_connection(path: str, readonly: bool = False, factory=InstrumentedConnection, synchronous: str = "NORMAL") -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        factory=factory,
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {synchronous}")
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = {DB_CACHE_SIZE}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
     conn.execute("PRAGMA foreign_keys = ON")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
     return conn
 
 
+class PooledConnection(InstrumentedConnection):
+    """sqlite3 connection whose close() hands it back to the pool."""
+
+    pool = None
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+            return
+        self.pool.release(self)
+
+    def really_close(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Connections are opened lazily (up to ``size``) and tuned once by
+    open_connection() instead of on every get_db() call.
+    """
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE, readonly: bool = False):
+        self.path = path
+        self.size = size
+        self.readonly = readonly
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+    def _connect(self) -> PooledConnection:
+        conn = open_connection(self.path, readonly=self.readonly, factory=PooledConnection)
+        conn.pool = self
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        return self._idle.get(timeout=DB_POOL_TIMEOUT)
+
+    def release(self, conn: PooledConnection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close_all(self):
+        with self._lock:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.really_close()
+                self._opened -= 1
+
+
+_pools: dict = {}
+_pool_lock = threading.Lock()
+
+
+def get_pool(readonly: bool = False) -> ConnectionPool:
+    key = (DB_PATH, readonly)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                size = DB_READ_POOL_SIZE if readonly else DB_POOL_SIZE
+                pool = _pools[key] = ConnectionPool(DB_PATH, size=size, readonly=readonly)
+    return pool
+
+
+def close_pools():
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.close_all()
+        _pools.clear()
+
+
+def get_db():
+    """Read-write pooled connection for startup code and scripts.
+
+    Request handlers go through db_read() / db_write() instead.
+    """
+    return get_pool().acquire()
+
+
+def get_read_db():
+    return get_pool(readonly=True).acquire()
+
+
+_read_executor = ThreadPoolExecutor(max_workers=DB_READ_POOL_SIZE, thread_name_prefix="db-read")
+
+
+def _run_read(fn, args):
+    conn = get_read_db()
+    try:
+        return fn(conn, *args)
+    finally:
+        conn.close()
+
+
+async def db_read(fn, *args):
+    """Run ``fn(conn, *args)`` on a read-only connection off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_read_executor, contextvars.copy_context().run, _run_read, fn, args)
+
+
+def _resolve(future: asyncio.Future, result=None, error: Optional[BaseException] = None):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class DatabaseWriter:
+    """Single thread that owns the only write connection.
+
+    Every INSERT/UPDATE/DELETE goes through submit(), so writers queue in
+    process instead of contending for SQLite's lock. Jobs that arrive within
+    WRITE_FLUSH_INTERVAL_MS of each other (up to WRITE_BATCH_SIZE) share one
+    transaction and one fsync (group commit). Each job runs inside its own
+    savepoint, so a failing job is rolled back alone, and no coroutine is
+    answered until the batch has been committed with synchronous=FULL.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.batches = 0
+        self.jobs = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, path: str):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                if self.path == path:
+                    return
+                self._stop_locked()
+            self.path = path
+            self._thread = threading.Thread(target=self._run, args=(path,), name="db-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stop_locked()
+
+    def _stop_locked(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _next_batch(self) -> tuple:
+        """Block for one job, then gather more until the flush window closes."""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + WRITE_FLUSH_INTERVAL_MS / 1000
+        while len(batch) < WRITE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                return batch, True
+            batch.append(job)
+        return batch, False
+
+    def _run(self, path: str):
+        # FULL is affordable here because the fsync is shared by the whole batch
+        conn = open_connection(path, synchronous="FULL")
+        conn.isolation_level = None  # transactions are managed explicitly below
+        if ATTEMPTS_RETENTION_DAYS > 0:
+            attach_attempts_archive(conn)
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch:
+                break
+            outcomes = []
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                for fn, args, future, loop, stats in batch:
+                    token = _request_stats.set(stats)
+                    conn.execute("SAVEPOINT job")
+                    try:
+                        result = fn(conn, *args)
+                    except Exception as exc:
+                        conn.execute("ROLLBACK TO job")
+                        outcomes.append((None, exc))
+                    else:
+                        outcomes.append((result, None))
+                    conn.execute("RELEASE job")
+                    _request_stats.reset(token)
+                conn.execute("COMMIT")
+            except BaseException as exc:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                outcomes = [(None, exc)] * len(batch)
+            self.batches += 1
+            self.jobs += len(batch)
+            for (fn, args, future, loop, stats), (result, error) in zip(batch, outcomes):
+                loop.call_soon_threadsafe(_resolve, future, result, error)
+        conn.close()
+
+    async def submit(self, fn, *args):
+        if self._thread is None or self.path != DB_PATH:
+            self.start(DB_PATH)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((fn, args, future, loop, _request_stats.get()))
+        return await future
+
+
+db_writer = DatabaseWriter()
+
+
+async def db_write(fn, *args):
+    """Run ``fn(conn, *args)`` in its own transaction on the writer thread."""
+    return await db_writer.submit(fn, *args)
+
+
 def now_iso():
     return datetime.utcnow().isoformat()
 
@@ -161,6 +927,13 @@ def init_db():
     ensure_column(conn, "questions", "image_path", "TEXT")
     ensure_column(conn, "questions", "source", "TEXT")
     ensure_column(conn, "suggestions", "image_path", "TEXT")
+    ensure_column(conn, "questions", "content_hash", "TEXT")
+    ensure_indexes(conn)
+    ensure_search_index(conn)
+    ensure_counters(conn)
+    ensure_attempt_rollups(conn)
+    ensure_content_hashes(conn)
+    ensure_near_duplicate_index(conn)
 
     cur.execute("SELECT id FROM users WHERE role='admin' LIMIT 1")
     admin = cur.fetchone()
@@ -178,10 +951,356 @@ def init_db():
     conn.close()
 
 
+# ---------- Caches ----------
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and now - item[1] < self.ttl:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def delete_where(self, predicate):
+        with self._lock:
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+CACHES: dict = {}
+
+
+def register_cache(cache: TTLCache) -> TTLCache:
+    CACHES[cache.name] = cache
+    return cache
+
+
+# ---------- Page cache ----------
+
+# Public pages whose anonymous rendering is the same for every visitor
+PAGE_CACHE_PATHS = re.compile(r"^/(questions(/past)?|subjects(/\d+)?)?$")
+
+page_cache = register_cache(TTLCache("pages", maxsize=PAGE_CACHE_SIZE, ttl=PAGE_CACHE_TTL))
+_page_generation = 0
+
+
+def invalidate_pages(*paths: str):
+    """Drop the cached anonymous pages for ``paths`` (every query string)."""
+    global _page_generation
+    _page_generation += 1
+    page_cache.delete_where(lambda key: key[0] in paths)
+
+
+class PageCacheMiddleware:
+    """Serve anonymous GETs of the public listing pages from page_cache.
+
+    Only requests carrying neither the login nor the flash cookie qualify, so
+    nothing user-specific is stored. Entries carry an ETag, so a browser
+    that already has the page gets a 304 without anything being rendered.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET" or not PAGE_CACHE_PATHS.match(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        request = Request(scope)
+        if SESSION_COOKIE in request.cookies or "flash" in request.cookies:
+            await self.app(scope, receive, send)
+            return
+
+        key = (scope["path"], scope["query_string"])
+        entry = page_cache.get(key)
+        if entry is None:
+            generation = _page_generation
+            messages = []
+
+            async def capture(message):
+                messages.append(message)
+
+            await self.app(scope, receive, capture)
+            start = next(m for m in messages if m["type"] == "http.response.start")
+            if start["status"] != 200 or any(name == b"set-cookie" for name, _ in start["headers"]):
+                for message in messages:
+                    await send(message)
+                return
+            body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+            etag = f'"{hashlib.sha1(body).hexdigest()[:20]}"'
+            headers = [*start["headers"], (b"etag", etag.encode()), (b"cache-control", b"no-cache"), (b"vary", b"Cookie")]
+            entry = (headers, body, etag)
+            # a write that landed mid-render may already be in this body
+            if generation == _page_generation:
+                page_cache.set(key, entry)
+
+        headers, body, etag = entry
+        if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+            await send({"type": "http.response.start", "status": 304, "headers": [h for h in headers if h[0] in (b"etag", b"cache-control", b"vary")]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+app.add_middleware(PageCacheMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+# ---------- Question totals ----------
+
+SUBJECT_PAGE_SIZE = 50
+# Safety net for writes made outside the app (seed scripts, manual SQL).
+QUESTION_TOTALS_TTL = 300
+
+_question_totals: dict = {}
+_question_totals_lock = threading.Lock()
+
+
+def question_total(conn: sqlite3.Connection, subject_id: int, source: str, exam: Optional[str]) -> int:
+    """Number of questions in a (subject, source, exam_type) list, cached until a write."""
+    key = (subject_id, source, exam if exam and exam != "both" else None)
+    now = time.monotonic()
+    with _question_totals_lock:
+        hit = _question_totals.get(key)
+    if hit and now - hit[1] < QUESTION_TOTALS_TTL:
+        return hit[0]
+    sql = "SELECT COUNT(*) FROM questions WHERE subject_id = ? AND source = ?"
+    params = [subject_id, source]
+    if key[2]:
+        sql += " AND exam_type = ?"
+        params.append(key[2])
+    total = conn.execute(sql, params).fetchone()[0]
+    with _question_totals_lock:
+        _question_totals[key] = (total, now)
+    return total
+
+
+def invalidate_question_totals(subject_id: Optional[int] = None):
+    with _question_totals_lock:
+        if subject_id is None:
+            _question_totals.clear()
+        else:
+            for key in [k for k in _question_totals if k[0] == subject_id]:
+                del _question_totals[key]
+
+
+# ---------- Question navigation ----------
+
+class NavigationIndex:
+    """Sorted question ids per (subject_id, exam_type, source) for prev/next links.
+
+    Lists are loaded from the database the first time a key is used and then
+    kept current by the admin write paths, so rendering a question needs a
+    bisect instead of two neighbour queries.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._ids: dict = {}
+        self._lock = threading.Lock()
+
+    def _load(self, conn: sqlite3.Connection, key) -> list:
+        rows = conn.execute(
+            "SELECT id FROM questions WHERE subject_id = ? AND exam_type = ? AND source = ? ORDER BY id",
+            key,
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def ids(self, conn: sqlite3.Connection, key) -> list:
+        """The sorted id list for ``key``; read it under the index lock only."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._ids.get(key)
+        if entry is None or now - entry[1] >= self.ttl:
+            ids = self._load(conn, key)
+            with self._lock:
+                self._ids[key] = (ids, now)
+            return ids
+        return entry[0]
+
+    def neighbours(self, conn: sqlite3.Connection, key, question_id: int):
+        ids = self.ids(conn, key)
+        with self._lock:
+            pos = bisect.bisect_left(ids, question_id)
+            prev_id = ids[pos - 1] if pos > 0 else None
+            if pos < len(ids) and ids[pos] == question_id:
+                pos += 1
+            next_id = ids[pos] if pos < len(ids) else None
+        return prev_id, next_id
+
+    def sample(self, conn: sqlite3.Connection, keys, k: int) -> list:
+        """Up to ``k`` distinct random ids across the lists for ``keys``.
+
+        Picks positions in the concatenated lists instead of copying them, so
+        a draw costs O(k) once the lists are loaded.
+        """
+        lists = [self.ids(conn, key) for key in keys]
+        with self._lock:
+            total = sum(len(ids) for ids in lists)
+            picked = []
+            for pos in random.sample(range(total), min(k, total)):
+                for ids in lists:
+                    if pos < len(ids):
+                        picked.append(ids[pos])
+                        break
+                    pos -= len(ids)
+        return picked
+
+    def add(self, key, question_id: int):
+        with self._lock:
+            entry = self._ids.get(key)
+            if entry is not None:
+                ids = entry[0]
+                pos = bisect.bisect_left(ids, question_id)
+                if pos == len(ids) or ids[pos] != question_id:
+                    ids.insert(pos, question_id)
+
+    def discard(self, key, question_id: int):
+        with self._lock:
+            entry = self._ids.get(key)
+            if entry is not None:
+                ids = entry[0]
+                pos = bisect.bisect_left(ids, question_id)
+                if pos < len(ids) and ids[pos] == question_id:
+                    del ids[pos]
+
+    def drop_subject(self, subject_id: int):
+        with self._lock:
+            for key in [k for k in self._ids if k[0] == subject_id]:
+                del self._ids[key]
+
+
+nav_index = NavigationIndex(ttl=NAV_INDEX_TTL)
+
+
+def nav_key(q) -> tuple:
+    return (q["subject_id"], q["exam_type"], q["source"])
+
+
+def question_neighbours(conn: sqlite3.Connection, q):
+    return nav_index.neighbours(conn, nav_key(q), q["id"])
+
+
+# ---------- Leaderboard ----------
+
+class Leaderboard:
+    """Non-admin users ordered by (points DESC, created_at ASC), kept in memory.
+
+    Entries are sorted (-points, created_at, id) tuples, so top-N and pages are
+    slices and "how many users have more points than p" is one bisect.
+    answer_question and exam_submit call set_points() with the total a write
+    committed instead of re-sorting the users table on every dashboard load;
+    setting the total (not adding a delta) keeps it right whether a reload
+    read the users table before or after that commit.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._keys: list = []
+        self._users: dict = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self, conn: sqlite3.Connection):
+        # read and swap under the lock, so a set_points() cannot land in between and be lost
+        with self._lock:
+            now = time.monotonic()
+            if self._loaded_at is not None and now - self._loaded_at < self.ttl:
+                return
+            rows = conn.execute(
+                "SELECT id, username, full_name, points, created_at FROM users WHERE role != 'admin'"
+            ).fetchall()
+            self._users = {row["id"]: dict(row) for row in rows}
+            self._keys = sorted((-u["points"], u["created_at"], u["id"]) for u in self._users.values())
+            self._loaded_at = now
+
+    def top(self, conn: sqlite3.Connection, limit: int, offset: int = 0) -> list:
+        self._ensure_loaded(conn)
+        with self._lock:
+            return [self._users[key[2]] for key in self._keys[offset:offset + limit]]
+
+    def size(self, conn: sqlite3.Connection) -> int:
+        self._ensure_loaded(conn)
+        with self._lock:
+            return len(self._keys)
+
+    def rank_for_points(self, conn: sqlite3.Connection, points: int) -> int:
+        """1 + number of non-admin users with strictly more points."""
+        self._ensure_loaded(conn)
+        with self._lock:
+            return bisect.bisect_left(self._keys, (-points,)) + 1
+
+    def set_points(self, user_id: int, points: int):
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return
+            old_key = (-user["points"], user["created_at"], user_id)
+            pos = bisect.bisect_left(self._keys, old_key)
+            if pos < len(self._keys) and self._keys[pos] == old_key:
+                del self._keys[pos]
+            user["points"] = points
+            bisect.insort(self._keys, (-user["points"], user["created_at"], user_id))
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+
+leaderboard = Leaderboard(ttl=LEADERBOARD_TTL)
+
+
 # ---------- Auth helpers ----------
 
+_serializer = URLSafeSerializer(SECRET_KEY, salt="session")
+
+
 def get_serializer():
-    return URLSafeSerializer(SECRET_KEY, salt="session")
+    return _serializer
 
 
 
@@ -192,7 +1311,559 @@ def ensure_column(conn: sqlite3.Connection, table: str, column: str, col_type: s
         conn.commit()
 
 
+# Secondary indexes for the hot lookups. check_query_plans.py fails if a query
+# in this file falls back to a full table scan, so add new ones here.
+INDEXES = {
+    # question lists and prev/next neighbours: subject_id/source/exam_type = ?, ordered by id
+    "idx_questions_subject_source_exam": "questions(subject_id, source, exam_type, id)",
+    # the same lists without an exam filter (source=ai, exam=both)
+    "idx_questions_subject_source": "questions(subject_id, source, id)",
+    # API cursor and pack id lists: subject_id = ? ordered by id (the rowid is implicit)
+    "idx_questions_subject": "questions(subject_id)",
+    # pack delta: subject_id = ? AND updated_at > ?
+    "idx_questions_subject_updated": "questions(subject_id, updated_at)",
+    # already_correct / latest attempt / per-user stats
+    "idx_attempts_user_question": "attempts(user_id, question_id, is_correct)",
+    # ON DELETE CASCADE from questions
+    "idx_attempts_question": "attempts(question_id)",
+    # archiving: created_at < ?, oldest first
+    "idx_attempts_created": "attempts(created_at)",
+    # leaderboard (points DESC, created_at ASC) and rank (points > ?)
+    "idx_users_points": "users(points DESC, created_at, role)",
+    "idx_suggestions_status_created": "suggestions(status, created_at)",
+    "idx_suggestions_created": "suggestions(created_at)",
+    "idx_reports_status": "reports(status)",
+    "idx_reports_created": "reports(created_at)",
+    "idx_reports_question": "reports(question_id)",
+}
+
+
+def ensure_indexes(conn: sqlite3.Connection):
+    for name, target in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+
+
+# ---------- Search ----------
+
+# Letters folded together for search: alef/hamza forms, alef maqsura, ta marbuta,
+# tatweel and tashkeel. Applied in Python to queries and in SQL by the FTS triggers.
+ARABIC_FOLDS = {
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه",
+    "ـ": "",
+    **{chr(c): "" for c in range(0x064B, 0x0653)},
+    "ٰ": "",
+}
+_ARABIC_FOLD_TABLE = str.maketrans(ARABIC_FOLDS)
+FTS_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def normalize_arabic(text: Optional[str]) -> str:
+    return (text or "").translate(_ARABIC_FOLD_TABLE).lower()
+
+
+def _sql_fold(expr: str) -> str:
+    for src, dst in ARABIC_FOLDS.items():
+        expr = f"replace({expr}, '{src}', '{dst}')"
+    return expr
+
+
+def fts_query(q: str) -> Optional[str]:
+    """Turn free text into an FTS5 MATCH expression (prefix AND of tokens)."""
+    tokens = FTS_TOKEN_RE.findall(normalize_arabic(q))
+    if not tokens:
+        return None
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def _fts_row_values(ref: str) -> str:
+    choices = " || ' ' || ".join(f"coalesce({ref}.choice_{c}, '')" for c in "abcd")
+    return ", ".join([
+        f"{ref}.id",
+        _sql_fold(f"coalesce({ref}.question_text, '')"),
+        _sql_fold(f"({choices})"),
+        _sql_fold(f"coalesce({ref}.explanation, '')"),
+    ])
+
+
+def ensure_search_triggers(conn: sqlite3.Connection):
+    insert = f"INSERT INTO questions_fts(rowid, question_text, choices, explanation) VALUES ({_fts_row_values('new')});"
+    delete = "DELETE FROM questions_fts WHERE rowid = old.id;"
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS questions_fts_ai AFTER INSERT ON questions BEGIN {insert} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS questions_fts_ad AFTER DELETE ON questions BEGIN {delete} END")
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS questions_fts_au AFTER UPDATE OF question_text, choice_a, choice_b, choice_c, choice_d, explanation "
+        f"ON questions BEGIN {delete} {insert} END"
+    )
+
+
+def index_questions_after(conn: sqlite3.Connection, after_id: int):
+    """Add questions with id > ``after_id`` to the search index in one statement.
+
+    Bulk loaders drop the questions_fts_ai trigger, insert, then call this and
+    ensure_search_triggers(); one INSERT ... SELECT is several times faster
+    than the trigger firing per row.
+    """
+    conn.execute(
+        f"INSERT INTO questions_fts(rowid, question_text, choices, explanation) SELECT {_fts_row_values('questions')} FROM questions WHERE questions.id > ?",
+        (after_id,),
+    )
+
+
+def ensure_search_index(conn: sqlite3.Connection):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'questions_fts'").fetchone()
+    conn.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5("
+        "question_text, choices, explanation, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    ensure_search_triggers(conn)
+    if not exists:
+        # question text outweighs choices, which outweigh the explanation
+        conn.execute("INSERT INTO questions_fts(questions_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 1.0)')")
+        index_questions_after(conn, 0)
+    conn.commit()
+
+
+# ---------- Question content hash ----------
+
+def clean_text(text: Optional[str]) -> str:
+    """Stored form of imported text: NFC, trailing spaces and blank-line runs removed."""
+    text = unicodedata.normalize("NFC", text or "").strip()
+    if "\n" in text:
+        text = re.sub(r"\n{3,}", "\n\n", "\n".join(line.rstrip() for line in text.splitlines()))
+    return text
+
+
+def fold_text(text: Optional[str]) -> str:
+    """Text as compared for duplicates: NFKC, search folding, single spaces."""
+    return " ".join(normalize_arabic(unicodedata.normalize("NFKC", text or "")).split())
+
+
+def question_content_hash(subject_id: int, exam_type: str, source: Optional[str], question_text: Optional[str], choices, image_path: Optional[str]) -> str:
+    """Identity of a question for de-duplication (stored in questions.content_hash).
+
+    Exam type and source are part of it, since each has its own listing and
+    the same question may appear in several. Answer and explanation are left
+    out so that correcting them updates the question instead of creating a
+    second one; text is folded like search so spacing, case and hamza
+    variants do not count.
+    """
+    parts = [str(subject_id), exam_type or "", source or "", image_path or ""]
+    parts += [fold_text(text) for text in (question_text, *choices)]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def question_save_error(exc: sqlite3.IntegrityError, duplicate: str) -> str:
+    """Flash text for a failed question write: ``duplicate`` only for a content_hash clash."""
+    if "questions.content_hash" in str(exc):
+        return duplicate
+    return f"تعذر حفظ السؤال: {exc}"
+
+
+def ensure_content_hashes(conn: sqlite3.Connection):
+    """Unique index on content_hash, and hashes for rows written without one.
+
+    Rows that duplicate an already hashed question keep a NULL hash. Hashes
+    from before exam type and source were included (still indexed by
+    idx_questions_content_hash) are recomputed once.
+    """
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_questions_content_hash'").fetchone():
+        conn.execute("DROP INDEX idx_questions_content_hash")
+        conn.execute("UPDATE questions SET content_hash = NULL")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_identity ON questions(content_hash)")
+    rows = conn.execute(
+        "SELECT id, subject_id, exam_type, source, question_text, choice_a, choice_b, choice_c, choice_d, image_path FROM questions WHERE content_hash IS NULL ORDER BY id"
+    ).fetchall()
+    conn.executemany(
+        "UPDATE OR IGNORE questions SET content_hash = ? WHERE id = ?",
+        [
+            (
+                question_content_hash(r["subject_id"], r["exam_type"], r["source"], r["question_text"], (r["choice_a"], r["choice_b"], r["choice_c"], r["choice_d"]), r["image_path"]),
+                r["id"],
+            )
+            for r in rows
+        ],
+    )
+    conn.commit()
+
+
+# ---------- Near-duplicate index ----------
+
+# One-permutation MinHash: each shingle is hashed once, the top bits pick a
+# slot and the rest compete for that slot's minimum. Empty slots borrow from
+# the next filled one. Rows of MINHASH_ROWS slots form a band; questions
+# sharing any band key are candidates, pre-filtered by matching slots and
+# confirmed by the exact Jaccard similarity of their shingles.
+MINHASH_ROWS = MINHASH_SLOTS // MINHASH_BANDS
+_MINHASH_SLOT_BITS = (MINHASH_SLOTS - 1).bit_length()
+_MINHASH_VALUE_MASK = (1 << (32 - _MINHASH_SLOT_BITS)) - 1
+_MINHASH_EMPTY = 1 << 32
+
+NEAR_DUPLICATE_TRIGGER_BODY = (
+    "BEGIN DELETE FROM question_lsh WHERE question_id = old.id; "
+    "DELETE FROM question_signatures WHERE question_id = old.id; END"
+)
+
+
+def question_shingles(question_text: Optional[str], choices) -> Optional[set]:
+    """Character shingles of the folded question text plus its choices (in any order).
+
+    Returns None for questions without text (image-only), which are not indexed.
+    """
+    question = fold_text(question_text)
+    if not question:
+        return None
+    text = " | ".join([question, *sorted(fold_text(c) for c in choices)])
+    return {text[i:i + MINHASH_SHINGLE] for i in range(max(1, len(text) - MINHASH_SHINGLE + 1))}
+
+
+def minhash_signature(shingles: set) -> array:
+    slots = [_MINHASH_EMPTY] * MINHASH_SLOTS
+    for h in map(zlib.crc32, map(str.encode, shingles)):
+        h = (h * 0x9E3779B1) & 0xFFFFFFFF
+        slot = h >> (32 - _MINHASH_SLOT_BITS)
+        value = h & _MINHASH_VALUE_MASK
+        if value < slots[slot]:
+            slots[slot] = value
+    filled = [i for i, v in enumerate(slots) if v != _MINHASH_EMPTY]
+    for i in range(MINHASH_SLOTS):
+        if slots[i] == _MINHASH_EMPTY:
+            j = next((k for k in filled if k > i), filled[0])
+            # offset by the distance so borrowed values only match the same borrowing
+            slots[i] = slots[j] + (((j - i) % MINHASH_SLOTS) << (32 - _MINHASH_SLOT_BITS))
+    return array("I", slots)
+
+
+def lsh_keys(signature: array) -> list:
+    return [
+        (band << 32) | zlib.crc32(signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS].tobytes())
+        for band in range(MINHASH_BANDS)
+    ]
+
+
+def signature_similarity(a: array, b: array) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return sum(x == y for x, y in zip(a, b)) / MINHASH_SLOTS
+
+
+def _choices(row) -> tuple:
+    return row["choice_a"], row["choice_b"], row["choice_c"], row["choice_d"]
+
+
+def signature_rows(questions) -> list:
+    """(id, signature bytes, LSH keys) for (id, question_text, choices) tuples.
+
+    Pure computation, so callers can run it off the writer thread. Image-only
+    questions get an empty signature so they are not revisited.
+    """
+    rows = []
+    for question_id, question_text, choices in questions:
+        shingles = question_shingles(question_text, choices)
+        if shingles is None:
+            rows.append((question_id, b"", []))
+        else:
+            signature = minhash_signature(shingles)
+            rows.append((question_id, signature.tobytes(), lsh_keys(signature)))
+    return rows
+
+
+def store_signatures(conn: sqlite3.Connection, rows: list):
+    """Write signature_rows() output; questions that already have one are left alone.
+
+    Text edits drop a question's rows through triggers, so a signature that is
+    present is never older than the text it was computed from.
+    """
+    for question_id, signature, keys in rows:
+        if conn.execute("INSERT OR IGNORE INTO question_signatures (question_id, signature) VALUES (?, ?)", (question_id, signature)).rowcount:
+            conn.executemany("INSERT OR IGNORE INTO question_lsh (key, question_id) VALUES (?, ?)", [(key, question_id) for key in keys])
+
+
+def index_question_signatures(conn: sqlite3.Connection, ids: Optional[list] = None):
+    """Index the given questions, or every question without a signature."""
+    if ids is None:
+        rows = conn.execute(
+            "SELECT id, question_text, choice_a, choice_b, choice_c, choice_d FROM questions "
+            "WHERE NOT EXISTS (SELECT 1 FROM question_signatures s WHERE s.question_id = questions.id)"
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            f"SELECT id, question_text, choice_a, choice_b, choice_c, choice_d FROM questions WHERE id IN ({', '.join('?' * len(ids))})",
+            ids,
+        ).fetchall()
+    store_signatures(conn, signature_rows((r["id"], r["question_text"], _choices(r)) for r in rows))
+
+
+def similar_questions(conn: sqlite3.Connection, question_text: Optional[str], choices, subject_id: Optional[int] = None, exclude_id: Optional[int] = None) -> list:
+    """Existing questions at least NEAR_DUPLICATE_THRESHOLD similar, best first.
+
+    Returns rows of (id, subject_id, question_text, similarity).
+    """
+    shingles = question_shingles(question_text, choices)
+    if shingles is None:
+        return []
+    signature = minhash_signature(shingles)
+    # very common bands (boilerplate wording) are read only up to a cap
+    bands = Counter()
+    for key in lsh_keys(signature):
+        bands.update(r["question_id"] for r in conn.execute("SELECT question_id FROM question_lsh WHERE key = ? LIMIT ?", (key, NEAR_DUPLICATE_BUCKET_LIMIT)))
+    bands.pop(exclude_id, None)
+    ids = [question_id for question_id, _ in bands.most_common(NEAR_DUPLICATE_CANDIDATES)]
+    if not ids:
+        return []
+    rows = conn.execute(
+        "SELECT q.id, q.subject_id, q.question_text, q.choice_a, q.choice_b, q.choice_c, q.choice_d, s.signature FROM questions q "
+        f"JOIN question_signatures s ON s.question_id = q.id WHERE q.id IN ({', '.join('?' * len(ids))})",
+        ids,
+    ).fetchall()
+    matches = []
+    for r in rows:
+        if subject_id is not None and r["subject_id"] != subject_id:
+            continue
+        # the estimate spreads about +-0.06 at 64 slots; clear misses skip the exact check
+        if signature_similarity(signature, array("I", r["signature"])) < NEAR_DUPLICATE_THRESHOLD - 0.15:
+            continue
+        other = question_shingles(r["question_text"], _choices(r))
+        similarity = len(shingles & other) / len(shingles | other)
+        if similarity >= NEAR_DUPLICATE_THRESHOLD:
+            matches.append({"id": r["id"], "subject_id": r["subject_id"], "question_text": r["question_text"], "similarity": similarity})
+    return sorted(matches, key=lambda m: -m["similarity"])
+
+
+def ensure_near_duplicate_index(conn: sqlite3.Connection):
+    conn.execute("CREATE TABLE IF NOT EXISTS question_signatures (question_id INTEGER PRIMARY KEY, signature BLOB NOT NULL)")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS question_lsh (key INTEGER NOT NULL, question_id INTEGER NOT NULL, "
+        "PRIMARY KEY (key, question_id)) WITHOUT ROWID"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_question_lsh_question ON question_lsh(question_id)")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS near_duplicates_ad AFTER DELETE ON questions {NEAR_DUPLICATE_TRIGGER_BODY}")
+    conn.execute(
+        "CREATE TRIGGER IF NOT EXISTS near_duplicates_au AFTER UPDATE OF question_text, choice_a, choice_b, choice_c, choice_d "
+        f"ON questions {NEAR_DUPLICATE_TRIGGER_BODY}"
+    )
+    index_question_signatures(conn)
+    conn.commit()
+
+
+# ---------- Admin counters ----------
+
+def _bump(name_sql: str, delta: int) -> str:
+    return f"INSERT INTO counters (name, value) VALUES ({name_sql}, {delta}) ON CONFLICT(name) DO UPDATE SET value = value + {delta};"
+
+
+def _status_triggers(table: str, counter: str) -> dict:
+    """Keep ``counter`` equal to the number of ``table`` rows whose status is 'new'."""
+    return {
+        f"counters_{table}_ai": f"AFTER INSERT ON {table} WHEN new.status = 'new' BEGIN UPDATE counters SET value = value + 1 WHERE name = '{counter}'; END",
+        f"counters_{table}_ad": f"AFTER DELETE ON {table} WHEN old.status = 'new' BEGIN UPDATE counters SET value = value - 1 WHERE name = '{counter}'; END",
+        f"counters_{table}_au": (
+            f"AFTER UPDATE OF status ON {table} WHEN (new.status = 'new') != (old.status = 'new') BEGIN "
+            f"UPDATE counters SET value = value + (CASE WHEN new.status = 'new' THEN 1 ELSE -1 END) WHERE name = '{counter}'; END"
+        ),
+    }
+
+
+_count_new_subject_question = _bump("'subject_questions:' || new.subject_id", 1)
+
+# Decrements use UPDATE rather than an upsert: when a subject is deleted its
+# questions cascade after (or before) the subject's own counter row is dropped.
+COUNTER_TRIGGERS = {
+    "counters_questions_ai": (
+        "AFTER INSERT ON questions BEGIN UPDATE counters SET value = value + 1 WHERE name = 'questions'; "
+        f"{_count_new_subject_question} END"
+    ),
+    "counters_questions_ad": (
+        "AFTER DELETE ON questions BEGIN UPDATE counters SET value = value - 1 "
+        "WHERE name IN ('questions', 'subject_questions:' || old.subject_id); END"
+    ),
+    "counters_questions_au": (
+        "AFTER UPDATE OF subject_id ON questions WHEN new.subject_id != old.subject_id BEGIN "
+        "UPDATE counters SET value = value - 1 WHERE name = 'subject_questions:' || old.subject_id; "
+        f"{_count_new_subject_question} END"
+    ),
+    "counters_subjects_ai": "AFTER INSERT ON subjects BEGIN UPDATE counters SET value = value + 1 WHERE name = 'subjects'; END",
+    "counters_subjects_ad": (
+        "AFTER DELETE ON subjects BEGIN UPDATE counters SET value = value - 1 WHERE name = 'subjects'; "
+        "DELETE FROM counters WHERE name = 'subject_questions:' || old.id; END"
+    ),
+    **_status_triggers("suggestions", "suggestions_new"),
+    **_status_triggers("reports", "reports_new"),
+}
+
+
+def rebuild_counters(conn: sqlite3.Connection):
+    """Recompute every counter from the base tables."""
+    conn.execute("DELETE FROM counters")
+    conn.execute("INSERT INTO counters (name, value) SELECT 'questions', COUNT(*) FROM questions")
+    conn.execute("INSERT INTO counters (name, value) SELECT 'subjects', COUNT(*) FROM subjects")
+    conn.execute("INSERT INTO counters (name, value) SELECT 'suggestions_new', COUNT(*) FROM suggestions WHERE status = 'new'")
+    conn.execute("INSERT INTO counters (name, value) SELECT 'reports_new', COUNT(*) FROM reports WHERE status = 'new'")
+    conn.execute(
+        "INSERT INTO counters (name, value) SELECT 'subject_questions:' || subject_id, COUNT(*) FROM questions GROUP BY subject_id"
+    )
+
+
+def ensure_counters(conn: sqlite3.Connection):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'counters'").fetchone()
+    conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL) WITHOUT ROWID")
+    for name, body in COUNTER_TRIGGERS.items():
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+    if not exists:
+        rebuild_counters(conn)
+    conn.commit()
+
+
+def read_counters(conn: sqlite3.Connection) -> dict:
+    rows = conn.execute(
+        "SELECT name, value FROM counters WHERE name IN ('questions', 'subjects', 'suggestions_new', 'reports_new')"
+    ).fetchall()
+    return {row["name"]: row["value"] for row in rows}
+
+
+# ---------- Attempt rollups ----------
+
+# Kept up to date by a trigger on attempts and never decremented, so they
+# survive archiving: per-user totals for the dashboard, per-question daily
+# counts, and the (user, question) pairs already answered correctly, which
+# decide whether an answer earns a point.
+ROLLUP_TABLES = {
+    "user_attempt_totals": (
+        "user_id INTEGER PRIMARY KEY, attempts INTEGER NOT NULL, correct INTEGER NOT NULL, "
+        "FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE"
+    ),
+    "question_daily_stats": (
+        "question_id INTEGER NOT NULL, day TEXT NOT NULL, attempts INTEGER NOT NULL, correct INTEGER NOT NULL, "
+        "PRIMARY KEY (question_id, day), FOREIGN KEY(question_id) REFERENCES questions(id) ON DELETE CASCADE"
+    ),
+    "solved_questions": (
+        "user_id INTEGER NOT NULL, question_id INTEGER NOT NULL, solved_at TEXT NOT NULL, "
+        "PRIMARY KEY (user_id, question_id), FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE, "
+        "FOREIGN KEY(question_id) REFERENCES questions(id) ON DELETE CASCADE"
+    ),
+}
+
+ROLLUP_TRIGGER = (
+    "AFTER INSERT ON attempts BEGIN "
+    "INSERT INTO user_attempt_totals (user_id, attempts, correct) VALUES (new.user_id, 1, new.is_correct) "
+    "ON CONFLICT(user_id) DO UPDATE SET attempts = attempts + 1, correct = correct + excluded.correct; "
+    "INSERT INTO question_daily_stats (question_id, day, attempts, correct) VALUES (new.question_id, substr(new.created_at, 1, 10), 1, new.is_correct) "
+    "ON CONFLICT(question_id, day) DO UPDATE SET attempts = attempts + 1, correct = correct + excluded.correct; "
+    "INSERT OR IGNORE INTO solved_questions (user_id, question_id, solved_at) SELECT new.user_id, new.question_id, new.created_at WHERE new.is_correct = 1; "
+    "END"
+)
+
+
+def rebuild_attempt_rollups(conn: sqlite3.Connection):
+    """Recompute the rollups from the attempts still in the main database."""
+    for table in ROLLUP_TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    conn.execute(
+        "INSERT INTO user_attempt_totals (user_id, attempts, correct) "
+        "SELECT user_id, COUNT(*), SUM(is_correct) FROM attempts GROUP BY user_id"
+    )
+    conn.execute(
+        "INSERT INTO question_daily_stats (question_id, day, attempts, correct) "
+        "SELECT question_id, substr(created_at, 1, 10), COUNT(*), SUM(is_correct) FROM attempts GROUP BY question_id, substr(created_at, 1, 10)"
+    )
+    conn.execute(
+        "INSERT INTO solved_questions (user_id, question_id, solved_at) "
+        "SELECT user_id, question_id, MIN(created_at) FROM attempts WHERE is_correct = 1 GROUP BY user_id, question_id"
+    )
+
+
+def ensure_attempt_rollups(conn: sqlite3.Connection):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'solved_questions'").fetchone()
+    for table, columns in ROLLUP_TABLES.items():
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns}){' WITHOUT ROWID' if table != 'user_attempt_totals' else ''}")
+    # ON DELETE CASCADE from questions
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_solved_questions_question ON solved_questions(question_id)")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS rollups_attempts_ai {ROLLUP_TRIGGER}")
+    if not exists:
+        rebuild_attempt_rollups(conn)
+    conn.commit()
+
+
+# ---------- Attempt archive ----------
+
+archive_log = logging.getLogger("bank.archive")
+
+
+def attempts_archive_path() -> str:
+    return ATTEMPTS_ARCHIVE_PATH or str(Path(DB_PATH).with_name("attempts_archive.db"))
+
+
+def attach_attempts_archive(conn: sqlite3.Connection):
+    """Attach the archive database to the writer connection (outside any transaction)."""
+    conn.execute("ATTACH DATABASE ? AS archive", (attempts_archive_path(),))
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS archive.attempts (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, question_id INTEGER NOT NULL, "
+        "chosen_choice TEXT NOT NULL, is_correct INTEGER NOT NULL, created_at TEXT NOT NULL)"
+    )
+
+
+ARCHIVE_OLDEST_SQL = "SELECT id FROM main.attempts WHERE created_at < ? ORDER BY created_at, id LIMIT ?"
+
+
+def copy_attempts_to_archive(conn: sqlite3.Connection, before: str, batch_size: int):
+    conn.execute(
+        "INSERT OR IGNORE INTO archive.attempts (id, user_id, question_id, chosen_choice, is_correct, created_at) "
+        f"SELECT id, user_id, question_id, chosen_choice, is_correct, created_at FROM main.attempts WHERE id IN ({ARCHIVE_OLDEST_SQL})",
+        (before, batch_size),
+    )
+
+
+def delete_archived_attempts(conn: sqlite3.Connection, before: str, batch_size: int) -> int:
+    return conn.execute(f"DELETE FROM main.attempts WHERE id IN ({ARCHIVE_OLDEST_SQL})", (before, batch_size)).rowcount
+
+
+async def archive_attempts(before: Optional[str] = None, batch_size: int = ATTEMPTS_ARCHIVE_BATCH) -> int:
+    """Move attempts created before ``before`` into the archive database.
+
+    Defaults to ATTEMPTS_RETENTION_DAYS ago; the writer only attaches the
+    archive when that is set. Each batch is two db_write() jobs: the copy is
+    committed before the same rows are deleted, since a WAL transaction is not
+    atomic across attached databases. INSERT OR IGNORE makes an interrupted
+    run safe to repeat. Returns the number of attempts moved.
+    """
+    if before is None:
+        if ATTEMPTS_RETENTION_DAYS <= 0:
+            return 0
+        before = (datetime.utcnow() - timedelta(days=ATTEMPTS_RETENTION_DAYS)).isoformat()
+    moved = 0
+    while True:
+        await db_write(copy_attempts_to_archive, before, batch_size)
+        deleted = await db_write(delete_archived_attempts, before, batch_size)
+        moved += deleted
+        if deleted < batch_size:
+            break
+    if moved:
+        archive_log.info("archived %d attempts created before %s", moved, before)
+    return moved
+
+
+async def _archive_loop():
+    while True:
+        try:
+            await archive_attempts()
+        except Exception:
+            archive_log.exception("archiving attempts failed")
+        await asyncio.sleep(ATTEMPTS_ARCHIVE_INTERVAL)
+
+
+# ---------- Images ----------
+
+_image_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="images")
+
+
 def save_upload_image(file: UploadFile) -> Optional[str]:
+    """Stream an upload to disk under its content hash.
+
+    Raises ValueError when the file is larger than UPLOAD_MAX_BYTES. The same
+    image uploaded twice is stored once; resized variants are generated in
+    the background.
+    """
     if not file or not file.filename:
         return None
     ext = Path(file.filename).suffix.lower()
@@ -202,13 +1873,108 @@ def save_upload_image(file: UploadFile) -> Optional[str]:
             ext = ".jpg"
         else:
             return None
-    name = f"{uuid.uuid4().hex}{ext}"
-    dest = UPLOAD_DIR / name
-    with dest.open("wb") as f:
-        f.write(file.file.read())
+    if ext in (".jpeg", ".jfif"):
+        ext = ".jpg"
+    digest = hashlib.sha256()
+    size = 0
+    tmp = UPLOAD_DIR / f".upload-{uuid.uuid4().hex}"
+    try:
+        with tmp.open("wb") as f:
+            while True:
+                chunk = file.file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise ValueError("image too large")
+                digest.update(chunk)
+                f.write(chunk)
+        name = f"{digest.hexdigest()[:32]}{ext}"
+        dest = UPLOAD_DIR / name
+        if dest.exists():
+            tmp.unlink()
+        else:
+            os.replace(tmp, dest)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    _image_executor.submit(make_image_variants, dest)
     return f"uploads/{name}"
 
 
+def variant_path(original: Path, variant: str) -> Path:
+    return original.with_name(f"{original.stem}.{variant}.webp")
+
+
+def make_image_variants(original: Path):
+    """Write the downscaled WebP variants of ``original`` that are missing."""
+    if Image is None:
+        return
+    todo = [(v, w) for v, w in IMAGE_VARIANTS.items() if not variant_path(original, v).exists()]
+    if not todo:
+        return
+    try:
+        with Image.open(original) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+            for variant, width in todo:
+                out = img.copy()
+                if out.width > width:
+                    out = out.resize((width, round(out.height * width / out.width)), Image.LANCZOS)
+                dest = variant_path(original, variant)
+                tmp = dest.with_name(f".{dest.name}")
+                out.save(tmp, "WEBP", quality=IMAGE_VARIANT_QUALITY, method=4)
+                os.replace(tmp, dest)
+    except (OSError, Image.DecompressionBombError):
+        # not a decodable image; pages keep serving the original
+        pass
+
+
+def backfill_image_variants():
+    for original in UPLOAD_DIR.iterdir():
+        if original.name.startswith(".") or original.suffix.lower() not in ALLOWED_IMAGE_EXTS:
+            continue
+        if Path(original.stem).suffix[1:] in IMAGE_VARIANTS:
+            continue  # a variant we wrote (name.display.webp), not an upload
+        make_image_variants(original)
+
+
+def image_variant(image_path: str, variant: str) -> str:
+    """Static path of a resized variant, or the original until it exists."""
+    resized = variant_path(BASE_DIR / "static" / image_path, variant)
+    if resized.exists():
+        return Path(image_path).with_name(resized.name).as_posix()
+    return image_path
+
+
+templates.env.globals["image_variant"] = image_variant
+
+
+# ---------- Question fragments ----------
+
+fragment_cache = register_cache(TTLCache("fragments", maxsize=FRAGMENT_CACHE_SIZE, ttl=FRAGMENT_CACHE_TTL))
+
+
+def question_fragment(q, name: str) -> Markup:
+    """Render ``_question_<name>.html`` for ``q``, reused until it changes.
+
+    Keyed by updated_at, so edits never need explicit invalidation; the
+    resolved image variant is part of the key so a page picks up the resized
+    image once it has been generated.
+    """
+    image = image_variant(q["image_path"], "display") if q["image_path"] else None
+    key = (name, q["id"], q["updated_at"], image)
+    html = fragment_cache.get(key)
+    if html is None:
+        html = Markup(templates.get_template(f"_question_{name}.html").render(q=q, image=image))
+        fragment_cache.set(key, html)
+    return html
+
+
+templates.env.globals["question_fragment"] = question_fragment
+
+
 def hash_password(password: str) -> str:
     # bcrypt limit is 72 bytes; pre-hash if longer
     pw_bytes = password.encode("utf-8")
@@ -224,7 +1990,11 @@ def verify_password(password: str, password_hash: str) -> bool:
     return bcrypt.checkpw(pw_bytes, password_hash.encode("utf-8"))
 
 
-def get_current_user(request: Request):
+def _load_user(conn: sqlite3.Connection, user_id: int):
+    return conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
+
+
+async def get_current_user(request: Request):
     cookie = request.cookies.get(SESSION_COOKIE)
     if not cookie:
         return None
@@ -236,12 +2006,23 @@ def get_current_user(request: Request):
     user_id = data.get("user_id")
     if not user_id:
         return None
-    conn = get_db()
-    user = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+    user = await db_read(_load_user, user_id)
+    if user is not None:
+        user_cache.set(user_id, user)
     return user
 
 
+def invalidate_user(user_id: int):
+    """Call after changing a user's points or role, or deleting them."""
+    user_cache.delete(user_id)
+
+
+user_cache = register_cache(TTLCache("users", maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL))
+
+
 def login_user(response: RedirectResponse, user_id: int):
     s = get_serializer()
     token = s.dumps({"user_id": user_id})
@@ -252,23 +2033,27 @@ def logout_user(response: RedirectResponse):
     response.delete_cookie(SESSION_COOKIE)
 
 
-def require_user(request: Request):
-    user = get_current_user(request)
+async def require_user(request: Request):
+    user = await get_current_user(request)
     if not user:
         return RedirectResponse(url="/login", status_code=303)
     return user
 
 
-def require_admin(request: Request):
-    user = get_current_user(request)
+async def require_admin(request: Request):
+    user = await get_current_user(request)
     if not user or user["role"] != "admin":
         return RedirectResponse(url="/login", status_code=303)
     return user
 
 
+def _all_subjects(conn: sqlite3.Connection):
+    return conn.execute("SELECT * FROM subjects ORDER BY name").fetchall()
+
+
 @app.get("/", response_class=HTMLResponse)
-def home(request: Request):
-    user = get_current_user(request)
+async def home(request: Request):
+    user = await get_current_user(request)
     return templates.TemplateResponse(
         "home.html",
         {
@@ -280,8 +2065,8 @@ def home(request: Request):
 
 
 @app.get("/questions", response_class=HTMLResponse)
-def questions_home(request: Request):
-    user = get_current_user(request)
+async def questions_home(request: Request):
+    user = await get_current_user(request)
     return templates.TemplateResponse(
         "questions_home.html",
         {"request": request, "user": user, "flash": request.session.pop("flash", None)},
@@ -289,8 +2074,8 @@ def questions_home(request: Request):
 
 
 @app.get("/questions/past", response_class=HTMLResponse)
-def questions_past(request: Request):
-    user = get_current_user(request)
+async def questions_past(request: Request):
+    user = await get_current_user(request)
     return templates.TemplateResponse(
         "questions_past.html",
         {"request": request, "user": user, "flash": request.session.pop("flash", None)},
@@ -298,8 +2083,8 @@ def questions_past(request: Request):
 
 
 @app.get("/subjects", response_class=HTMLResponse)
-def subjects_list(request: Request, source: str = "past", exam: Optional[str] = None):
-    user = get_current_user(request)
+async def subjects_list(request: Request, source: str = "past", exam: Optional[str] = None):
+    user = await get_current_user(request)
     if source not in ("past", "ai"):
         source = "past"
     if source == "past":
@@ -307,9 +2092,7 @@ def subjects_list(request: Request, source: str = "past", exam: Optional[str] =
             return RedirectResponse(url="/questions/past", status_code=303)
     else:
         exam = None
-    conn = get_db()
-    subjects = conn.execute("SELECT * FROM subjects ORDER BY name").fetchall()
-    conn.close()
+    subjects = await db_read(_all_subjects)
     return templates.TemplateResponse(
         "subjects_list.html",
         {
@@ -324,27 +2107,26 @@ def subjects_list(request: Request, source: str = "past", exam: Optional[str] =
 
 
 @app.get("/register", response_class=HTMLResponse)
-def register_get(request: Request):
+async def register_get(request: Request):
     return templates.TemplateResponse("register.html", {"request": request, "flash": request.session.pop("flash", None)})
 
 
 @app.post("/register")
-def register_post(request: Request, username: str = Form(...), password: str = Form(...), full_name: Optional[str] = Form(None)):
+async def register_post(request: Request, username: str = Form(...), password: str = Form(...), full_name: Optional[str] = Form(None)):
     request.session["flash"] = "التسجيل للطلاب متوقف. الدخول متاح فقط للإدارة."
     return RedirectResponse(url="/register", status_code=303)
 
 
 @app.get("/login", response_class=HTMLResponse)
-def login_get(request: Request):
+async def login_get(request: Request):
     return templates.TemplateResponse("login.html", {"request": request, "flash": request.session.pop("flash", None)})
 
 
 @app.post("/login")
-def login_post(request: Request, username: str = Form(...), password: str = Form(...)):
-    conn = get_db()
-    user = conn.execute("SELECT * FROM users WHERE username = ?", (username.strip(),)).fetchone()
-    conn.close()
-    if not user or not verify_password(password, user["password_hash"]):
+async def login_post(request: Request, username: str = Form(...), password: str = Form(...)):
+    user = await db_read(lambda conn: conn.execute("SELECT * FROM users WHERE username = ?", (username.strip(),)).fetchone())
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not user or not await run_in_threadpool(verify_password, password, user["password_hash"]):
         request.session["flash"] = "بيانات الدخول غير صحيحة"
         return RedirectResponse(url="/login", status_code=303)
     if user["role"] != "admin":
@@ -353,136 +2135,208 @@ def login_post(request: Request, username: str = Form(...), password: str = Form
 
     response = RedirectResponse(url="/dashboard", status_code=303)
     login_user(response, user["id"])
+    invalidate_user(user["id"])
     return response
 
 
 @app.get("/logout")
-def logout(request: Request):
+async def logout(request: Request):
     response = RedirectResponse(url="/", status_code=303)
     logout_user(response)
     return response
 
 
 @app.get("/dashboard", response_class=HTMLResponse)
-def dashboard(request: Request):
-    user = require_admin(request)
+async def dashboard(request: Request):
+    user = await require_admin(request)
     if isinstance(user, RedirectResponse):
         return user
-    conn = get_db()
-    stats = conn.execute(
-        "SELECT COUNT(*) as total_attempts, SUM(is_correct) as total_correct FROM attempts WHERE user_id = ?",
-        (user["id"],),
-    ).fetchone()
-    leaderboard = conn.execute(
-        "SELECT id, username, full_name, points FROM users WHERE role != 'admin' ORDER BY points DESC, created_at ASC LIMIT 10"
-    ).fetchall()
-    rank_row = conn.execute(
-        "SELECT COUNT(*) + 1 AS rank FROM users WHERE role != 'admin' AND points > ?",
-        (user["points"],),
-    ).fetchone()
-    conn.close()
 
+    def load(conn):
+        stats = conn.execute(
+            "SELECT attempts AS total_attempts, correct AS total_correct FROM user_attempt_totals WHERE user_id = ?",
+            (user["id"],),
+        ).fetchone()
+        return stats or {"total_attempts": 0, "total_correct": 0}, leaderboard.top(conn, 10), leaderboard.rank_for_points(conn, user["points"])
+
+    stats, top_users, rank = await db_read(load)
     return templates.TemplateResponse(
         "dashboard.html",
-        {"request": request, "user": user, "stats": stats, "leaderboard": leaderboard, "rank": rank_row["rank"], "flash": request.session.pop("flash", None)},
+        {"request": request, "user": user, "stats": stats, "leaderboard": top_users, "rank": rank, "flash": request.session.pop("flash", None)},
     )
 
 
-@app.get("/subjects/{subject_id}", response_class=HTMLResponse)
-def subject_view(request: Request, subject_id: int, exam: Optional[str] = None, source: str = "past", q: Optional[str] = None, page: int = 1):
-    user = get_current_user(request)
-    conn = get_db()
-    subject = conn.execute("SELECT * FROM subjects WHERE id = ?", (subject_id,)).fetchone()
-    if not subject:
-        conn.close()
-        return RedirectResponse(url="/", status_code=303)
+@app.get("/leaderboard", response_class=HTMLResponse)
+async def leaderboard_view(request: Request, page: int = 1):
+    user = await require_admin(request)
+    if isinstance(user, RedirectResponse):
+        return user
+    page = max(1, page)
+    per_page = LEADERBOARD_PAGE_SIZE
+
+    def load(conn):
+        return leaderboard.top(conn, per_page, (page - 1) * per_page), leaderboard.size(conn)
+
+    users, total = await db_read(load)
+    return templates.TemplateResponse(
+        "leaderboard.html",
+        {
+            "request": request,
+            "user": user,
+            "users": users,
+            "first_rank": (page - 1) * per_page + 1,
+            "page": page,
+            "total_pages": max(1, (total + per_page - 1) // per_page),
+            "flash": request.session.pop("flash", None),
+        },
+    )
+
 
+@app.get("/subjects/{subject_id}", response_class=HTMLResponse)
+async def subject_view(request: Request, subject_id: int, exam: Optional[str] = None, source: str = "past", q: Optional[str] = None, page: int = 1, before: Optional[int] = None, after: Optional[int] = None):
+    user = await get_current_user(request)
     if source not in ("past", "ai"):
         source = "past"
+    valid_exam = True
     if source == "past":
-        if exam not in ("mid", "final", "both"):
-            conn.close()
-            return RedirectResponse(url="/questions/past", status_code=303)
+        valid_exam = exam in ("mid", "final", "both")
     else:
         exam = None
-    per_page = 50
-    offset = (page - 1) * per_page
-    base_query = "FROM questions WHERE subject_id = ?"
-    params = [subject_id]
-    if exam and exam != "both":
-        base_query += " AND exam_type = ?"
-        params.append(exam)
-    base_query += " AND source = ?"
-    params.append(source)
-    if q:
-        base_query += " AND question_text LIKE ?"
-        params.append(f"%{q}%")
-
-    total = conn.execute(f"SELECT COUNT(*) {base_query}", params).fetchone()[0]
-    questions = conn.execute(
-        f"SELECT * {base_query} ORDER BY id DESC LIMIT ? OFFSET ?",
-        params + [per_page, offset],
-    ).fetchall()
-    conn.close()
+    per_page = SUBJECT_PAGE_SIZE
+    page = max(1, page)
+    match = fts_query(q) if q else None
+
+    def load(conn):
+        subject = conn.execute("SELECT * FROM subjects WHERE id = ?", (subject_id,)).fetchone()
+        if not subject or not valid_exam:
+            return subject, None
+        prev_cursor = None
+        next_cursor = None
+        current_page = page
+        if match:
+            base_query = "FROM questions_fts JOIN questions ON questions.id = questions_fts.rowid WHERE questions_fts MATCH ? AND subject_id = ?"
+            params = [match, subject_id]
+        else:
+            base_query = "FROM questions WHERE subject_id = ?"
+            params = [subject_id]
+        if exam and exam != "both":
+            base_query += " AND exam_type = ?"
+            params.append(exam)
+        base_query += " AND source = ?"
+        params.append(source)
+
+        if match:
+            # ranked search results are short, so they keep plain page numbers
+            total = conn.execute(f"SELECT COUNT(*) {base_query}", params).fetchone()[0]
+            questions = conn.execute(
+                f"SELECT questions.* {base_query} ORDER BY questions_fts.rank LIMIT ? OFFSET ?",
+                params + [per_page, (page - 1) * per_page],
+            ).fetchall()
+        else:
+            # keyset pagination: every page is an index range scan from a known id
+            total = question_total(conn, subject_id, source, exam)
+            if after is not None:
+                rows = conn.execute(
+                    f"SELECT * {base_query} AND id > ? ORDER BY id ASC LIMIT ?",
+                    params + [after, per_page + 1],
+                ).fetchall()
+                has_newer = len(rows) > per_page
+                questions = rows[:per_page][::-1]
+                if has_newer and questions:
+                    prev_cursor = questions[0]["id"]
+                else:
+                    current_page = 1
+                if questions:
+                    next_cursor = questions[-1]["id"]
+            else:
+                cursor_sql, cursor_params = ("", []) if before is None else (" AND id < ?", [before])
+                rows = conn.execute(
+                    f"SELECT * {base_query}{cursor_sql} ORDER BY id DESC LIMIT ?",
+                    params + cursor_params + [per_page + 1],
+                ).fetchall()
+                questions = rows[:per_page]
+                if len(rows) > per_page:
+                    next_cursor = questions[-1]["id"]
+                if before is not None and questions:
+                    prev_cursor = questions[0]["id"]
+                elif before is None:
+                    current_page = 1
+        return subject, {
+            "questions": questions,
+            "page": current_page,
+            "total": total,
+            "total_pages": max(1, (total + per_page - 1) // per_page),
+            "prev_cursor": prev_cursor,
+            "next_cursor": next_cursor,
+        }
+
+    subject, listing = await db_read(load)
+    if not subject:
+        return RedirectResponse(url="/", status_code=303)
+    if listing is None:
+        return RedirectResponse(url="/questions/past", status_code=303)
 
-    total_pages = max(1, (total + per_page - 1) // per_page)
     return templates.TemplateResponse(
         "subject.html",
-        {"request": request, "user": user, "subject": subject, "questions": questions, "exam": exam or "", "source": source, "q": q or "", "page": page, "total_pages": total_pages, "flash": request.session.pop("flash", None)},
+        {"request": request, "user": user, "subject": subject, "exam": exam or "", "source": source, "q": q or "", **listing, "flash": request.session.pop("flash", None)},
     )
 
 
-@app.get("/questions/{question_id}", response_class=HTMLResponse)
-def question_view(request: Request, question_id: int):
-    user = get_current_user(request)
-    conn = get_db()
+def _question_with_neighbours(conn: sqlite3.Connection, question_id: int):
     q = conn.execute(
         "SELECT q.*, s.name AS subject_name FROM questions q JOIN subjects s ON s.id = q.subject_id WHERE q.id = ?",
         (question_id,),
     ).fetchone()
-    prev_q = None
-    next_q = None
-    if q:
-        prev_q = conn.execute(
-            "SELECT id FROM questions WHERE subject_id = ? AND exam_type = ? AND source = ? AND id < ? ORDER BY id DESC LIMIT 1",
-            (q["subject_id"], q["exam_type"], q["source"], q["id"]),
-        ).fetchone()
-        next_q = conn.execute(
-            "SELECT id FROM questions WHERE subject_id = ? AND exam_type = ? AND source = ? AND id > ? ORDER BY id ASC LIMIT 1",
-            (q["subject_id"], q["exam_type"], q["source"], q["id"]),
-        ).fetchone()
-    conn.close()
+    if not q:
+        return None, None, None
+    prev_id, next_id = question_neighbours(conn, q)
+    return q, prev_id, next_id
+
+
+@app.get("/questions/{question_id}", response_class=HTMLResponse)
+async def question_view(request: Request, question_id: int):
+    user = await get_current_user(request)
+    q, prev_id, next_id = await db_read(_question_with_neighbours, question_id)
     if not q:
         return RedirectResponse(url="/", status_code=303)
 
     return templates.TemplateResponse(
         "question.html",
-        {"request": request, "user": user, "q": q, "prev_id": prev_q["id"] if prev_q else None, "next_id": next_q["id"] if next_q else None, "flash": request.session.pop("flash", None)},
+        {"request": request, "user": user, "q": q, "prev_id": prev_id, "next_id": next_id, "flash": request.session.pop("flash", None)},
     )
 
 
-@app.post("/questions/{question_id}/answer")
-def answer_question(request: Request, question_id: int, choice: str = Form(...)):
-    user = get_current_user(request)
-
-    conn = get_db()
-    q = conn.execute("SELECT * FROM questions WHERE id = ?", (question_id,)).fetchone()
+def _record_attempt(conn: sqlite3.Connection, user_id: int, question_id: int, choice: str, is_correct: int) -> Optional[int]:
+    """Insert one attempt; returns the user's new points total when it earned a point."""
+    already_correct = conn.execute(
+        "SELECT 1 FROM solved_questions WHERE user_id = ? AND question_id = ?",
+        (user_id, question_id),
+    ).fetchone()
+
+    conn.execute(
+        "INSERT INTO attempts (user_id, question_id, chosen_choice, is_correct, created_at) VALUES (?, ?, ?, ?, ?)",
+        (user_id, question_id, choice, is_correct, now_iso()),
+    )
+
+    if is_correct and not already_correct:
+        return conn.execute("UPDATE users SET points = points + 1 WHERE id = ? RETURNING points", (user_id,)).fetchone()[0]
+    return None
+
+
+@app.post("/questions/{question_id}/answer")
+async def answer_question(request: Request, question_id: int, choice: str = Form(...)):
+    user = await get_current_user(request)
+
+    if not user:
+        q, prev_id, next_id = await db_read(_question_with_neighbours, question_id)
+    else:
+        q = await db_read(lambda conn: conn.execute("SELECT * FROM questions WHERE id = ?", (question_id,)).fetchone())
     if not q:
-        conn.close()
         return RedirectResponse(url="/", status_code=303)
 
     is_correct = 1 if choice == q["correct_choice"] else 0
 
     if not user:
-        prev_q = conn.execute(
-            "SELECT id FROM questions WHERE subject_id = ? AND exam_type = ? AND source = ? AND id < ? ORDER BY id DESC LIMIT 1",
-            (q["subject_id"], q["exam_type"], q["source"], q["id"]),
-        ).fetchone()
-        next_q = conn.execute(
-            "SELECT id FROM questions WHERE subject_id = ? AND exam_type = ? AND source = ? AND id > ? ORDER BY id ASC LIMIT 1",
-            (q["subject_id"], q["exam_type"], q["source"], q["id"]),
-        ).fetchone()
-        conn.close()
         attempt = {"is_correct": is_correct, "chosen_choice": choice}
         return templates.TemplateResponse(
             "question_result.html",
@@ -491,377 +2345,1183 @@ def answer_question(request: Request, question_id: int, choice: str = Form(...))
                 "user": None,
                 "q": q,
                 "attempt": attempt,
-                "prev_id": prev_q["id"] if prev_q else None,
-                "next_id": next_q["id"] if next_q else None,
+                "prev_id": prev_id,
+                "next_id": next_id,
                 "flash": request.session.pop("flash", None),
             },
         )
 
-    already_correct = conn.execute(
-        "SELECT 1 FROM attempts WHERE user_id = ? AND question_id = ? AND is_correct = 1 LIMIT 1",
-        (user["id"], question_id),
-    ).fetchone()
-
-    conn.execute(
-        "INSERT INTO attempts (user_id, question_id, chosen_choice, is_correct, created_at) VALUES (?, ?, ?, ?, ?)",
-        (user["id"], question_id, choice, is_correct, now_iso()),
-    )
-
-    if is_correct and not already_correct:
-        conn.execute("UPDATE users SET points = points + 1 WHERE id = ?", (user["id"],))
-
-    conn.commit()
-    conn.close()
+    points = await db_write(_record_attempt, user["id"], question_id, choice, is_correct)
+    if points is not None:
+        invalidate_user(user["id"])
+        leaderboard.set_points(user["id"], points)
     return RedirectResponse(url=f"/questions/{question_id}/result", status_code=303)
 
 
 @app.get("/questions/{question_id}/result", response_class=HTMLResponse)
-def question_result(request: Request, question_id: int):
-    user = get_current_user(request)
-
-    conn = get_db()
-    q = conn.execute(
-        "SELECT q.*, s.name AS subject_name FROM questions q JOIN subjects s ON s.id = q.subject_id WHERE q.id = ?",
-        (question_id,),
-    ).fetchone()
+async def question_result(request: Request, question_id: int):
+    user = await get_current_user(request)
+
+    def load(conn):
+        q, prev_id, next_id = _question_with_neighbours(conn, question_id)
+        attempt = None
+        if q and user:
+            attempt = conn.execute(
+                "SELECT * FROM attempts WHERE user_id = ? AND question_id = ? ORDER BY id DESC LIMIT 1",
+                (user["id"], question_id),
+            ).fetchone()
+        return q, prev_id, next_id, attempt
+
+    q, prev_id, next_id, attempt = await db_read(load)
     if not q:
-        conn.close()
         return RedirectResponse(url="/", status_code=303)
-    prev_q = conn.execute(
-        "SELECT id FROM questions WHERE subject_id = ? AND exam_type = ? AND source = ? AND id < ? ORDER BY id DESC LIMIT 1",
-        (q["subject_id"], q["exam_type"], q["source"], q["id"]),
-    ).fetchone()
-    next_q = conn.execute(
-        "SELECT id FROM questions WHERE subject_id = ? AND exam_type = ? AND source = ? AND id > ? ORDER BY id ASC LIMIT 1",
-        (q["subject_id"], q["exam_type"], q["source"], q["id"]),
-    ).fetchone()
-    attempt = None
-    if user:
-        attempt = conn.execute(
-            "SELECT * FROM attempts WHERE user_id = ? AND question_id = ? ORDER BY id DESC LIMIT 1",
-            (user["id"], question_id),
-        ).fetchone()
-    conn.close()
 
     return templates.TemplateResponse(
         "question_result.html",
-        {"request": request, "user": user, "q": q, "attempt": attempt, "prev_id": prev_q["id"] if prev_q else None, "next_id": next_q["id"] if next_q else None, "flash": request.session.pop("flash", None)},
+        {"request": request, "user": user, "q": q, "attempt": attempt, "prev_id": prev_id, "next_id": next_id, "flash": request.session.pop("flash", None)},
     )
 
 
 @app.post("/questions/{question_id}/report")
-def report_question(request: Request, question_id: int, report_text: str = Form(...), proposed_correct_choice: Optional[str] = Form(None), proposed_explanation: Optional[str] = Form(None)):
-    user = get_current_user(request)
-    conn = get_db()
-    conn.execute(
-        "INSERT INTO reports (user_id, question_id, report_text, proposed_correct_choice, proposed_explanation, status, created_at) VALUES (?, ?, ?, ?, ?, 'new', ?)",
-        (user["id"] if user else None, question_id, report_text, proposed_correct_choice, proposed_explanation, now_iso()),
+async def report_question(request: Request, question_id: int, report_text: str = Form(...), proposed_correct_choice: Optional[str] = Form(None), proposed_explanation: Optional[str] = Form(None)):
+    user = await get_current_user(request)
+    await db_write(
+        lambda conn: conn.execute(
+            "INSERT INTO reports (user_id, question_id, report_text, proposed_correct_choice, proposed_explanation, status, created_at) VALUES (?, ?, ?, ?, ?, 'new', ?)",
+            (user["id"] if user else None, question_id, report_text, proposed_correct_choice, proposed_explanation, now_iso()),
+        )
     )
-    conn.commit()
-    conn.close()
     request.session["flash"] = "تم إرسال البلاغ"
     return RedirectResponse(url=f"/questions/{question_id}", status_code=303)
 
 
+# ---------- Exam sessions ----------
+
+def _exam_keys(subject_id: int, source: str, exam: Optional[str]) -> list:
+    exam_types = (exam,) if exam and exam != "both" else ("mid", "final", "both")
+    return [(subject_id, exam_type, source) for exam_type in exam_types]
+
+
+def _questions_by_id(conn: sqlite3.Connection, ids: list) -> list:
+    """Fetch questions in the order of ``ids`` with one IN query."""
+    rows = conn.execute(f"SELECT * FROM questions WHERE id IN ({', '.join('?' * len(ids))})", ids).fetchall()
+    by_id = {row["id"]: row for row in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+@app.get("/subjects/{subject_id}/exam", response_class=HTMLResponse)
+async def exam_start(request: Request, subject_id: int, source: str = "past", exam: Optional[str] = None, count: int = EXAM_DEFAULT_QUESTIONS):
+    user = await get_current_user(request)
+    if source not in ("past", "ai"):
+        source = "past"
+    if source == "past":
+        if exam not in ("mid", "final", "both"):
+            return RedirectResponse(url="/questions/past", status_code=303)
+    else:
+        exam = None
+    count = max(1, min(count, EXAM_MAX_QUESTIONS))
+
+    def load(conn):
+        subject = conn.execute("SELECT * FROM subjects WHERE id = ?", (subject_id,)).fetchone()
+        if not subject:
+            return None, []
+        ids = nav_index.sample(conn, _exam_keys(subject_id, source, exam), count)
+        return subject, _questions_by_id(conn, ids) if ids else []
+
+    subject, questions = await db_read(load)
+    if not subject:
+        return RedirectResponse(url="/", status_code=303)
+    if not questions:
+        request.session["flash"] = "لا توجد أسئلة في هذه المادة بعد"
+        return RedirectResponse(url=f"/subjects/{subject_id}?source={source}&exam={exam or ''}", status_code=303)
+
+    duration = EXAM_SECONDS_PER_QUESTION * len(questions)
+    token = get_serializer().dumps({
+        "sid": subject_id,
+        "ids": [q["id"] for q in questions],
+        "uid": user["id"] if user else None,
+        "deadline": int(time.time()) + duration,
+    })
+    return templates.TemplateResponse(
+        "exam.html",
+        {
+            "request": request,
+            "user": user,
+            "subject": subject,
+            "questions": questions,
+            "source": source,
+            "exam": exam or "",
+            "duration": duration,
+            "token": token,
+            "flash": request.session.pop("flash", None),
+        },
+    )
+
+
+def _grade_exam(conn: sqlite3.Connection, ids: list, answers: dict, user_id: Optional[int] = None):
+    """Grade a whole sheet; for a signed-in user record it in the same transaction.
+
+    Returns ([(question, chosen, is_correct), ...], points gained, the user's
+    new points total or None).
+    """
+    graded = [(q, answers.get(q["id"]), answers.get(q["id"]) == q["correct_choice"]) for q in _questions_by_id(conn, ids)]
+    if user_id is None:
+        return graded, 0, None
+    answered = [(q["id"], chosen, is_correct) for q, chosen, is_correct in graded if chosen]
+    if not answered:
+        return graded, 0, None
+    answered_ids = [question_id for question_id, _, _ in answered]
+    already_correct = {
+        row[0]
+        for row in conn.execute(
+            f"SELECT question_id FROM solved_questions WHERE user_id = ? AND question_id IN ({', '.join('?' * len(answered_ids))})",
+            [user_id, *answered_ids],
+        )
+    }
+    stamp = now_iso()
+    conn.executemany(
+        "INSERT INTO attempts (user_id, question_id, chosen_choice, is_correct, created_at) VALUES (?, ?, ?, ?, ?)",
+        [(user_id, question_id, chosen, 1 if is_correct else 0, stamp) for question_id, chosen, is_correct in answered],
+    )
+    gained = len({question_id for question_id, _, is_correct in answered if is_correct} - already_correct)
+    if not gained:
+        return graded, 0, None
+    points = conn.execute("UPDATE users SET points = points + ? WHERE id = ? RETURNING points", (gained, user_id)).fetchone()[0]
+    return graded, gained, points
+
+
+@app.post("/exam/submit", response_class=HTMLResponse)
+async def exam_submit(request: Request):
+    user = await get_current_user(request)
+    form = await request.form()
+    try:
+        sheet = get_serializer().loads(form.get("token", ""))
+    except BadSignature:
+        return RedirectResponse(url="/", status_code=303)
+    if sheet.get("uid") != (user["id"] if user else None):
+        request.session["flash"] = "جلسة الامتحان لا تخص هذا الحساب"
+        return RedirectResponse(url="/", status_code=303)
+    if time.time() > sheet["deadline"] + EXAM_GRACE_SECONDS:
+        request.session["flash"] = "انتهى وقت الامتحان"
+        return RedirectResponse(url=f"/subjects/{sheet['sid']}", status_code=303)
+
+    answers = {}
+    for question_id in sheet["ids"]:
+        choice = form.get(f"q{question_id}")
+        if choice in ("A", "B", "C", "D"):
+            answers[question_id] = choice
+
+    if user:
+        graded, gained, points = await db_write(_grade_exam, sheet["ids"], answers, user["id"])
+        if points is not None:
+            invalidate_user(user["id"])
+            leaderboard.set_points(user["id"], points)
+    else:
+        graded, gained, _ = await db_read(_grade_exam, sheet["ids"], answers)
+
+    return templates.TemplateResponse(
+        "exam_result.html",
+        {
+            "request": request,
+            "user": user,
+            "graded": graded,
+            "score": sum(1 for _, _, is_correct in graded if is_correct),
+            "answered": len(answers),
+            "gained": gained,
+            "flash": request.session.pop("flash", None),
+        },
+    )
+
+
+# ---------- JSON API ----------
+
+API_QUESTION_COLUMNS = (
+    "id, subject_id, exam_type, source, question_text, choice_a, choice_b, choice_c, choice_d, "
+    "correct_choice, explanation, image_path, updated_at"
+)
+
+
+def dumps_json(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _http_date(iso: str) -> str:
+    return format_datetime(datetime.fromisoformat(iso).replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+
+def api_response(request: Request, build, version: str, updated_at: Optional[str] = None) -> Response:
+    """JSON response with an ETag over ``version`` and a Last-Modified from ``updated_at``.
+
+    ``build`` is only called when the client's copy is stale, so a 304 skips
+    serialisation entirely.
+    """
+    etag = f'"{hashlib.sha1(version.encode("utf-8")).hexdigest()[:20]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if updated_at:
+        headers["Last-Modified"] = _http_date(updated_at)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+    elif updated_at and request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"])
+        except (TypeError, ValueError):
+            since = None
+        if since is not None and since >= parsedate_to_datetime(headers["Last-Modified"]):
+            return Response(status_code=304, headers=headers)
+    return Response(dumps_json(build()), media_type="application/json", headers=headers)
+
+
+def _rows_version(rows) -> tuple:
+    version = "|".join(f"{row['id']}:{row['updated_at']}" for row in rows)
+    return version, max((row["updated_at"] for row in rows), default=None)
+
+
+@app.get("/api/v1/subjects")
+async def api_subjects(request: Request):
+    rows = await db_read(
+        lambda conn: conn.execute(
+            "SELECT s.id, s.name, COALESCE(c.value, 0) AS questions FROM subjects s "
+            "LEFT JOIN counters c ON c.name = 'subject_questions:' || s.id ORDER BY s.name"
+        ).fetchall()
+    )
+    version = "|".join(f"{row['id']}:{row['name']}:{row['questions']}" for row in rows)
+    return api_response(request, lambda: {"subjects": [dict(row) for row in rows]}, version)
+
+
+@app.get("/api/v1/subjects/{subject_id}/questions")
+async def api_subject_questions(request: Request, subject_id: int, source: str = "", exam: str = "", cursor: int = 0, limit: int = API_PAGE_SIZE):
+    """Questions of a subject in id order; pass ``next_cursor`` back as ``cursor``."""
+    limit = max(1, min(limit, API_MAX_PAGE_SIZE))
+    clauses = ["subject_id = ?"]
+    params = [subject_id]
+    if source in ("past", "ai"):
+        clauses.append("source = ?")
+        params.append(source)
+    if exam in ("mid", "final", "both"):
+        clauses.append("exam_type = ?")
+        params.append(exam)
+    clauses.append("id > ?")
+    params.append(cursor)
+    rows = await db_read(
+        lambda conn: conn.execute(
+            f"SELECT {API_QUESTION_COLUMNS} FROM questions WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?",
+            [*params, limit + 1],
+        ).fetchall()
+    )
+    next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+    rows = rows[:limit]
+    version, updated_at = _rows_version(rows)
+    return api_response(
+        request,
+        lambda: {"questions": [dict(row) for row in rows], "next_cursor": next_cursor},
+        f"{version}|{next_cursor}",
+        updated_at,
+    )
+
+
+@app.get("/api/v1/questions")
+async def api_questions(request: Request, ids: str = ""):
+    """Bulk fetch: ``?ids=1,2,3`` (at most API_MAX_PAGE_SIZE ids)."""
+    wanted = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip().isdigit()))[:API_MAX_PAGE_SIZE]
+    if not wanted:
+        return JSONResponse({"detail": "ids is required"}, status_code=400)
+    rows = await db_read(
+        lambda conn: conn.execute(
+            f"SELECT {API_QUESTION_COLUMNS} FROM questions WHERE id IN ({', '.join('?' * len(wanted))})",
+            wanted,
+        ).fetchall()
+    )
+    by_id = {row["id"]: row for row in rows}
+    rows = [by_id[i] for i in wanted if i in by_id]
+    version, updated_at = _rows_version(rows)
+    return api_response(
+        request,
+        lambda: {"questions": [dict(row) for row in rows], "missing": [i for i in wanted if i not in by_id]},
+        version,
+        updated_at,
+    )
+
+
+# ---------- Subject packs ----------
+
+class PackBuilder:
+    """Builds each subject's offline pack on a background thread.
+
+    A pack is the subject's questions as gzipped JSON, written to static/packs/
+    under its content hash so it can be cached as immutable. Encoded questions
+    are kept between builds keyed by updated_at and image variant, so a
+    rebuild after an edit only re-encodes the questions that changed.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="packs")
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._encoded = {}
+        self.manifests = {}
+
+    def schedule(self, *subject_ids: int):
+        """Queue a rebuild; repeated edits while one is queued share it."""
+        with self._lock:
+            todo = set(subject_ids) - self._pending
+            self._pending.update(todo)
+        for subject_id in todo:
+            self._executor.submit(self._build, subject_id)
+
+    def schedule_all(self):
+        conn = get_read_db()
+        try:
+            subject_ids = [row["id"] for row in conn.execute("SELECT id FROM subjects")]
+        finally:
+            conn.close()
+        self.schedule(*subject_ids)
+
+    def drop(self, subject_id: int):
+        self.manifests.pop(subject_id, None)
+        self._encoded.pop(subject_id, None)
+        for stale in PACK_DIR.glob(f"subject-{subject_id}-*.json.gz"):
+            stale.unlink(missing_ok=True)
+
+    @staticmethod
+    def _image_refs(image_path: Optional[str]) -> Optional[dict]:
+        if not image_path:
+            return None
+        refs = {"original": f"/static/{image_path}"}
+        for variant in IMAGE_VARIANTS:
+            refs[variant] = f"/static/{image_variant(image_path, variant)}"
+        return refs
+
+    def _build(self, subject_id: int):
+        with self._lock:
+            self._pending.discard(subject_id)
+        conn = get_read_db()
+        try:
+            subject = conn.execute("SELECT id, name FROM subjects WHERE id = ?", (subject_id,)).fetchone()
+            rows = conn.execute(f"SELECT {API_QUESTION_COLUMNS} FROM questions WHERE subject_id = ? ORDER BY id", (subject_id,)).fetchall() if subject else []
+        finally:
+            conn.close()
+        if subject is None:
+            self.drop(subject_id)
+            return
+        previous = self._encoded.get(subject_id, {})
+        encoded = {}
+        for row in rows:
+            images = self._image_refs(row["image_path"])
+            key = (row["updated_at"], images and images.get("display"))
+            cached = previous.get(row["id"])
+            if cached is None or cached[0] != key:
+                cached = (key, dumps_json({**dict(row), "images": images}))
+            encoded[row["id"]] = cached
+        self._encoded[subject_id] = encoded
+        version = max((row["updated_at"] for row in rows), default=None)
+        body = b"".join((
+            b'{"subject":', dumps_json(dict(subject)),
+            b',"version":', dumps_json(version),
+            b',"questions":[', b",".join(item[1] for item in encoded.values()), b"]}",
+        ))
+        digest = hashlib.sha256(body).hexdigest()[:16]
+        name = f"subject-{subject_id}-{digest}.json.gz"
+        dest = PACK_DIR / name
+        if not dest.exists():
+            tmp = PACK_DIR / f".{name}"
+            tmp.write_bytes(gzip.compress(body, mtime=0))
+            os.replace(tmp, dest)
+        for stale in PACK_DIR.glob(f"subject-{subject_id}-*.json.gz"):
+            if stale.name != name:
+                stale.unlink(missing_ok=True)
+        self.manifests[subject_id] = {
+            "subject_id": subject_id,
+            "version": version,
+            "hash": digest,
+            "url": f"/static/packs/{name}",
+            "size": dest.stat().st_size,
+            "questions": len(encoded),
+        }
+
+
+subject_packs = PackBuilder()
+
+
+@app.get("/api/v1/subjects/{subject_id}/pack")
+async def api_subject_pack(request: Request, subject_id: int):
+    """Manifest of the current pack; the pack itself is served from /static."""
+    manifest = subject_packs.manifests.get(subject_id)
+    if manifest is None:
+        exists = await db_read(lambda conn: conn.execute("SELECT 1 FROM subjects WHERE id = ?", (subject_id,)).fetchone())
+        if not exists:
+            return JSONResponse({"detail": "not found"}, status_code=404)
+        subject_packs.schedule(subject_id)
+        return JSONResponse({"detail": "pack is being built"}, status_code=202, headers={"Retry-After": "5"})
+    return api_response(request, lambda: manifest, manifest["hash"], manifest["version"])
+
+
+@app.get("/api/v1/subjects/{subject_id}/delta")
+async def api_subject_delta(request: Request, subject_id: int, since: str = ""):
+    """Questions changed after the pack ``version`` in ``since``.
+
+    ``ids`` lists every current question so clients can drop deleted ones.
+    """
+    def load(conn):
+        changed = conn.execute(
+            f"SELECT {API_QUESTION_COLUMNS} FROM questions WHERE subject_id = ? AND updated_at > ? ORDER BY updated_at, id",
+            (subject_id, since),
+        ).fetchall()
+        ids = [row["id"] for row in conn.execute("SELECT id FROM questions WHERE subject_id = ? ORDER BY id", (subject_id,))]
+        return changed, ids
+
+    changed, ids = await db_read(load)
+    version, updated_at = _rows_version(changed)
+    return api_response(
+        request,
+        lambda: {
+            "version": updated_at or since or None,
+            "questions": [{**dict(row), "images": PackBuilder._image_refs(row["image_path"])} for row in changed],
+            "ids": ids,
+        },
+        f"{since}|{version}|{','.join(map(str, ids))}",
+        updated_at,
+    )
+
+
 @app.get("/contact", response_class=HTMLResponse)
-def contact_get(request: Request):
-    user = get_current_user(request)
-    conn = get_db()
-    subjects = conn.execute("SELECT * FROM subjects ORDER BY name").fetchall()
-    conn.close()
+async def contact_get(request: Request):
+    user = await get_current_user(request)
+    subjects = await db_read(_all_subjects)
     return templates.TemplateResponse("contact.html", {"request": request, "user": user, "subjects": subjects, "flash": request.session.pop("flash", None)})
 
 
 @app.post("/contact/suggest")
-def contact_suggest(request: Request, subject_id: Optional[str] = Form(None), subject_name: Optional[str] = Form(None), exam_type: Optional[str] = Form(None), question_text: Optional[str] = Form(None), choice_a: Optional[str] = Form(None), choice_b: Optional[str] = Form(None), choice_c: Optional[str] = Form(None), choice_d: Optional[str] = Form(None), proposed_correct_choice: Optional[str] = Form(None), proposed_explanation: Optional[str] = Form(None)):
-    user = get_current_user(request)
-    conn = get_db()
-    conn.execute(
-        "INSERT INTO suggestions (user_id, type, subject_name, subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, proposed_correct_choice, proposed_explanation, image_path, status, created_at) VALUES (?, 'question', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'new', ?)",
-        (user["id"] if user else None, subject_name, subject_id or None, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, proposed_correct_choice, proposed_explanation, None, now_iso()),
+async def contact_suggest(request: Request, subject_id: Optional[str] = Form(None), subject_name: Optional[str] = Form(None), exam_type: Optional[str] = Form(None), question_text: Optional[str] = Form(None), choice_a: Optional[str] = Form(None), choice_b: Optional[str] = Form(None), choice_c: Optional[str] = Form(None), choice_d: Optional[str] = Form(None), proposed_correct_choice: Optional[str] = Form(None), proposed_explanation: Optional[str] = Form(None)):
+    user = await get_current_user(request)
+    await db_write(
+        lambda conn: conn.execute(
+            "INSERT INTO suggestions (user_id, type, subject_name, subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, proposed_correct_choice, proposed_explanation, image_path, status, created_at) VALUES (?, 'question', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'new', ?)",
+            (user["id"] if user else None, subject_name, subject_id or None, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, proposed_correct_choice, proposed_explanation, None, now_iso()),
+        )
     )
-    conn.commit()
-    conn.close()
     request.session["flash"] = "تم إرسال الاقتراح"
     return RedirectResponse(url="/contact", status_code=303)
 
 
 @app.post("/contact/message")
-def contact_message(request: Request, message: str = Form(...)):
-    user = get_current_user(request)
-    conn = get_db()
-    conn.execute(
-        "INSERT INTO suggestions (user_id, type, message, status, created_at) VALUES (?, 'message', ?, 'new', ?)",
-        (user["id"] if user else None, message, now_iso()),
+async def contact_message(request: Request, message: str = Form(...)):
+    user = await get_current_user(request)
+    await db_write(
+        lambda conn: conn.execute(
+            "INSERT INTO suggestions (user_id, type, message, status, created_at) VALUES (?, 'message', ?, 'new', ?)",
+            (user["id"] if user else None, message, now_iso()),
+        )
     )
-    conn.commit()
-    conn.close()
     request.session["flash"] = "تم إرسال الرسالة"
     return RedirectResponse(url="/contact", status_code=303)
 
 # ---------- Admin ----------
 
 @app.get("/admin", response_class=HTMLResponse)
-def admin_home(request: Request):
-    admin = require_admin(request)
+async def admin_home(request: Request):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
-    conn = get_db()
-    subjects = conn.execute("SELECT * FROM subjects ORDER BY name").fetchall()
-    subject_counts = conn.execute(
-        """
-        SELECT s.id, COUNT(q.id) AS qcount
-        FROM subjects s
-        LEFT JOIN questions q ON q.subject_id = s.id
-        GROUP BY s.id
-        """
-    ).fetchall()
-    subject_count_map = {row["id"]: row["qcount"] for row in subject_counts}
-    total_questions = conn.execute("SELECT COUNT(*) AS c FROM questions").fetchone()["c"]
-    total_subjects = conn.execute("SELECT COUNT(*) AS c FROM subjects").fetchone()["c"]
-    new_suggestions = conn.execute("SELECT COUNT(*) AS c FROM suggestions WHERE status = 'new'").fetchone()["c"]
-    new_reports = conn.execute("SELECT COUNT(*) AS c FROM reports WHERE status = 'new'").fetchone()["c"]
-    suggestions = conn.execute("SELECT * FROM suggestions ORDER BY created_at DESC").fetchall()
-    reports = conn.execute(
-        "SELECT r.*, q.question_text FROM reports r JOIN questions q ON q.id = r.question_id ORDER BY r.created_at DESC"
-    ).fetchall()
-    questions = conn.execute(
-        "SELECT q.*, s.name AS subject_name FROM questions q JOIN subjects s ON s.id = q.subject_id ORDER BY q.id DESC LIMIT 50"
-    ).fetchall()
-    conn.close()
+
+    def load(conn):
+        counters = read_counters(conn)
+        return {
+            "subjects": conn.execute(
+                "SELECT s.*, COALESCE(c.value, 0) AS qcount FROM subjects s "
+                "LEFT JOIN counters c ON c.name = 'subject_questions:' || s.id ORDER BY s.name"
+            ).fetchall(),
+            "total_questions": counters.get("questions", 0),
+            "total_subjects": counters.get("subjects", 0),
+            "new_suggestions": counters.get("suggestions_new", 0),
+            "new_reports": counters.get("reports_new", 0),
+        }
+
+    context = await db_read(load)
     return templates.TemplateResponse(
         "admin.html",
         {
             "request": request,
             "user": admin,
-            "subjects": subjects,
-            "subject_count_map": subject_count_map,
-            "total_questions": total_questions,
-            "total_subjects": total_subjects,
-            "new_suggestions": new_suggestions,
-            "new_reports": new_reports,
-            "suggestions": suggestions,
-            "reports": reports,
-            "questions": questions,
+            **context,
+            "flash": request.session.pop("flash", None),
+        },
+    )
+
+
+@app.get("/admin/tabs/{tab}", response_class=HTMLResponse)
+async def admin_tab(request: Request, tab: str, before: Optional[int] = None, subject_id: str = "", source: str = "", exam: str = "", q: str = ""):
+    """One keyset page of an admin tab, fetched when the tab is opened."""
+    admin = await require_admin(request)
+    if isinstance(admin, RedirectResponse):
+        return admin
+    if tab not in ("questions", "suggestions", "reports"):
+        return HTMLResponse("", status_code=404)
+
+    def load(conn):
+        context = {}
+        clauses = []
+        params = []
+        if tab == "questions":
+            if subject_id.isdigit():
+                clauses.append("q.subject_id = ?")
+                params.append(int(subject_id))
+            if source in ("past", "ai"):
+                clauses.append("q.source = ?")
+                params.append(source)
+            if exam in ("mid", "final", "both"):
+                clauses.append("q.exam_type = ?")
+                params.append(exam)
+            match = fts_query(q)
+            if match:
+                clauses.append("q.id IN (SELECT rowid FROM questions_fts WHERE questions_fts MATCH ?)")
+                params.append(match)
+            if before is not None:
+                clauses.append("q.id < ?")
+                params.append(before)
+            where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+            sql = f"SELECT q.*, s.name AS subject_name FROM questions q JOIN subjects s ON s.id = q.subject_id{where} ORDER BY q.id DESC LIMIT ?"
+        elif tab == "suggestions":
+            context["subjects"] = _all_subjects(conn)
+            if before is not None:
+                params.append(before)
+            sql = f"SELECT * FROM suggestions{' WHERE id < ?' if params else ''} ORDER BY id DESC LIMIT ?"
+            rows = conn.execute(sql, [*params, ADMIN_PAGE_SIZE + 1]).fetchall()
+            context["similar"] = {
+                s["id"]: similar_questions(conn, s["question_text"], _choices(s), s["subject_id"])
+                for s in rows[:ADMIN_PAGE_SIZE]
+                if s["type"] == "question" and s["status"] == "new"
+            }
+            return rows, context
+        else:
+            if before is not None:
+                params.append(before)
+            sql = (
+                "SELECT r.*, q.question_text FROM reports r JOIN questions q ON q.id = r.question_id"
+                f"{' WHERE r.id < ?' if params else ''} ORDER BY r.id DESC LIMIT ?"
+            )
+        return conn.execute(sql, [*params, ADMIN_PAGE_SIZE + 1]).fetchall(), context
+
+    rows, context = await db_read(load)
+    next_url = None
+    if len(rows) > ADMIN_PAGE_SIZE:
+        rows = rows[:ADMIN_PAGE_SIZE]
+        query = {k: v for k, v in (("subject_id", subject_id), ("source", source), ("exam", exam), ("q", q)) if v}
+        query["before"] = rows[-1]["id"]
+        next_url = f"/admin/tabs/{tab}?{urlencode(query)}"
+    return templates.TemplateResponse(
+        f"_admin_{tab}.html",
+        {"request": request, "rows": rows, "next_url": next_url, "first_page": before is None, **context},
+    )
+
+
+@app.get("/admin/cache-stats")
+async def admin_cache_stats(request: Request):
+    admin = await require_admin(request)
+    if isinstance(admin, RedirectResponse):
+        return admin
+    return JSONResponse({name: cache.stats() for name, cache in CACHES.items()})
+
+
+@app.get("/admin/slow-queries", response_class=HTMLResponse)
+async def admin_slow_queries(request: Request):
+    admin = await require_admin(request)
+    if isinstance(admin, RedirectResponse):
+        return admin
+    statements, latest = await run_in_threadpool(slow_query_report)
+    return templates.TemplateResponse(
+        "admin_slow_queries.html",
+        {
+            "request": request,
+            "user": admin,
+            "statements": statements,
+            "latest": latest,
+            "threshold_ms": SLOW_QUERY_MS,
             "flash": request.session.pop("flash", None),
         },
     )
 
 
+@app.get("/admin/metrics")
+async def admin_metrics(request: Request):
+    """Prometheus scrape endpoint (needs an admin session cookie)."""
+    admin = await require_admin(request)
+    if isinstance(admin, RedirectResponse):
+        return admin
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/admin/questions/{question_id}/edit", response_class=HTMLResponse)
-def admin_question_edit(request: Request, question_id: int):
-    admin = require_admin(request)
+async def admin_question_edit(request: Request, question_id: int):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
-    conn = get_db()
-    q = conn.execute(
-        "SELECT q.*, s.name AS subject_name FROM questions q JOIN subjects s ON s.id = q.subject_id WHERE q.id = ?",
-        (question_id,),
-    ).fetchone()
-    conn.close()
+
+    def load(conn):
+        q = conn.execute(
+            "SELECT q.*, s.name AS subject_name FROM questions q JOIN subjects s ON s.id = q.subject_id WHERE q.id = ?",
+            (question_id,),
+        ).fetchone()
+        stats = conn.execute(
+            "SELECT COALESCE(SUM(attempts), 0) AS attempts, COALESCE(SUM(correct), 0) AS correct FROM question_daily_stats WHERE question_id = ?",
+            (question_id,),
+        ).fetchone()
+        return q, stats
+
+    q, stats = await db_read(load)
     if not q:
         return RedirectResponse(url="/admin", status_code=303)
     return templates.TemplateResponse(
         "question_edit.html",
-        {"request": request, "user": admin, "q": q, "flash": request.session.pop("flash", None)},
+        {"request": request, "user": admin, "q": q, "stats": stats, "flash": request.session.pop("flash", None)},
     )
 
 
 @app.post("/admin/subjects/create")
-def admin_subject_create(request: Request, name: str = Form(...)):
-    admin = require_admin(request)
+async def admin_subject_create(request: Request, name: str = Form(...)):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
-    conn = get_db()
     try:
-        conn.execute("INSERT INTO subjects (name, created_at) VALUES (?, ?)", (name.strip(), now_iso()))
-        conn.commit()
+        await db_write(lambda conn: conn.execute("INSERT INTO subjects (name, created_at) VALUES (?, ?)", (name.strip(), now_iso())))
+        invalidate_pages("/subjects")
         request.session["flash"] = "تم إنشاء المادة"
     except sqlite3.IntegrityError:
         request.session["flash"] = "اسم المادة موجود بالفعل"
-    conn.close()
     return RedirectResponse(url="/admin", status_code=303)
 
 
 @app.post("/admin/subjects/{subject_id}/delete")
-def admin_subject_delete(request: Request, subject_id: int):
-    admin = require_admin(request)
+async def admin_subject_delete(request: Request, subject_id: int):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
-    conn = get_db()
-    conn.execute("DELETE FROM subjects WHERE id = ?", (subject_id,))
-    conn.commit()
-    conn.close()
+    await db_write(lambda conn: conn.execute("DELETE FROM subjects WHERE id = ?", (subject_id,)))
+    invalidate_question_totals(subject_id)
+    invalidate_pages("/subjects", f"/subjects/{subject_id}")
+    nav_index.drop_subject(subject_id)
+    subject_packs.schedule(subject_id)
     request.session["flash"] = "تم حذف المادة"
     return RedirectResponse(url="/admin", status_code=303)
 
 
 @app.post("/admin/questions/create")
-def admin_question_create(request: Request, subject_id: int = Form(...), exam_type: str = Form(...), source: str = Form("past"), question_text: str = Form(""), choice_a: str = Form(...), choice_b: str = Form(...), choice_c: str = Form(...), choice_d: str = Form(...), correct_choice: str = Form(...), explanation: Optional[str] = Form(None), image: UploadFile = File(None)):
-    admin = require_admin(request)
+async def admin_question_create(request: Request, subject_id: int = Form(...), exam_type: str = Form(...), source: str = Form("past"), question_text: str = Form(""), choice_a: str = Form(...), choice_b: str = Form(...), choice_c: str = Form(...), choice_d: str = Form(...), correct_choice: str = Form(...), explanation: Optional[str] = Form(None), image: UploadFile = File(None)):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
-    conn = get_db()
-    image_path = save_upload_image(image)
+    try:
+        image_path = await run_in_threadpool(save_upload_image, image)
+    except ValueError:
+        request.session["flash"] = "حجم الصورة يتجاوز الحد المسموح"
+        return RedirectResponse(url="/admin", status_code=303)
     if source not in ("past", "ai"):
         source = "past"
-    conn.execute(
-        "INSERT INTO questions (subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, image_path, source, explanation, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, image_path, source, explanation, now_iso(), now_iso()),
-    )
-    conn.commit()
-    conn.close()
+    choices = (choice_a, choice_b, choice_c, choice_d)
+    content_hash = question_content_hash(subject_id, exam_type, source, question_text, choices, image_path)
+
+    def insert(conn):
+        similar = similar_questions(conn, question_text, choices, subject_id)
+        question_id = conn.execute(
+            "INSERT INTO questions (subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, image_path, source, explanation, content_hash, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (subject_id, exam_type, question_text, *choices, correct_choice, image_path, source, explanation, content_hash, now_iso(), now_iso()),
+        ).lastrowid
+        index_question_signatures(conn, [question_id])
+        return question_id, similar
+
+    try:
+        question_id, similar = await db_write(insert)
+    except sqlite3.IntegrityError as exc:
+        request.session["flash"] = question_save_error(exc, "هذا السؤال موجود مسبقاً في المادة")
+        return RedirectResponse(url="/admin", status_code=303)
+    invalidate_question_totals(subject_id)
+    invalidate_pages(f"/subjects/{subject_id}")
+    nav_index.add((subject_id, exam_type, source), question_id)
+    subject_packs.schedule(subject_id)
     request.session["flash"] = "تم إضافة السؤال"
+    if similar:
+        request.session["flash"] += f"، وهو مشابه للسؤال #{similar[0]['id']} ({similar[0]['similarity']:.0%})"
     return RedirectResponse(url="/admin", status_code=303)
 
 
 @app.post("/admin/questions/{question_id}/update")
-def admin_question_update(request: Request, question_id: int, question_text: str = Form(""), source: str = Form("past"), choice_a: str = Form(...), choice_b: str = Form(...), choice_c: str = Form(...), choice_d: str = Form(...), correct_choice: str = Form(...), explanation: Optional[str] = Form(None), image: UploadFile = File(None)):
-    admin = require_admin(request)
+async def admin_question_update(request: Request, question_id: int, question_text: str = Form(""), source: str = Form("past"), choice_a: str = Form(...), choice_b: str = Form(...), choice_c: str = Form(...), choice_d: str = Form(...), correct_choice: str = Form(...), explanation: Optional[str] = Form(None), image: UploadFile = File(None)):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
-    conn = get_db()
-    image_path = save_upload_image(image)
+    try:
+        image_path = await run_in_threadpool(save_upload_image, image)
+    except ValueError:
+        request.session["flash"] = "حجم الصورة يتجاوز الحد المسموح"
+        return RedirectResponse(url=f"/admin/questions/{question_id}/edit", status_code=303)
     if source not in ("past", "ai"):
         source = "past"
-    if image_path:
-        conn.execute(
-            "UPDATE questions SET question_text = ?, choice_a = ?, choice_b = ?, choice_c = ?, choice_d = ?, correct_choice = ?, image_path = ?, source = ?, explanation = ?, updated_at = ? WHERE id = ?",
-            (question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, image_path, source, explanation, now_iso(), question_id),
-        )
-    else:
-        conn.execute(
-            "UPDATE questions SET question_text = ?, choice_a = ?, choice_b = ?, choice_c = ?, choice_d = ?, correct_choice = ?, source = ?, explanation = ?, updated_at = ? WHERE id = ?",
-            (question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, source, explanation, now_iso(), question_id),
-        )
-    conn.commit()
-    conn.close()
+
+    def update(conn):
+        old = conn.execute("SELECT subject_id, exam_type, source, image_path FROM questions WHERE id = ?", (question_id,)).fetchone()
+        if not old:
+            return None
+        content_hash = question_content_hash(old["subject_id"], old["exam_type"], source, question_text, (choice_a, choice_b, choice_c, choice_d), image_path or old["image_path"])
+        if image_path:
+            conn.execute(
+                "UPDATE questions SET question_text = ?, choice_a = ?, choice_b = ?, choice_c = ?, choice_d = ?, correct_choice = ?, image_path = ?, source = ?, explanation = ?, content_hash = ?, updated_at = ? WHERE id = ?",
+                (question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, image_path, source, explanation, content_hash, now_iso(), question_id),
+            )
+        else:
+            conn.execute(
+                "UPDATE questions SET question_text = ?, choice_a = ?, choice_b = ?, choice_c = ?, choice_d = ?, correct_choice = ?, source = ?, explanation = ?, content_hash = ?, updated_at = ? WHERE id = ?",
+                (question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, source, explanation, content_hash, now_iso(), question_id),
+            )
+        index_question_signatures(conn, [question_id])
+        return old
+
+    try:
+        old = await db_write(update)
+    except sqlite3.IntegrityError as exc:
+        request.session["flash"] = question_save_error(exc, "يوجد سؤال آخر مطابق لهذا النص في المادة")
+        return RedirectResponse(url=f"/admin/questions/{question_id}/edit", status_code=303)
+    invalidate_question_totals()
+    if old:
+        invalidate_pages(f"/subjects/{old['subject_id']}")
+        subject_packs.schedule(old["subject_id"])
+    if old and old["source"] != source:
+        nav_index.discard(nav_key(old), question_id)
+        nav_index.add((old["subject_id"], old["exam_type"], source), question_id)
     request.session["flash"] = "تم تحديث السؤال"
     return RedirectResponse(url=f"/admin/questions/{question_id}/edit", status_code=303)
 
 
 @app.post("/admin/questions/{question_id}/delete")
-def admin_question_delete(request: Request, question_id: int):
-    admin = require_admin(request)
+async def admin_question_delete(request: Request, question_id: int):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
-    conn = get_db()
-    conn.execute("DELETE FROM questions WHERE id = ?", (question_id,))
-    conn.commit()
-    conn.close()
+
+    def delete(conn):
+        old = conn.execute("SELECT subject_id, exam_type, source FROM questions WHERE id = ?", (question_id,)).fetchone()
+        conn.execute("DELETE FROM questions WHERE id = ?", (question_id,))
+        return old
+
+    old = await db_write(delete)
+    invalidate_question_totals()
+    if old:
+        invalidate_pages(f"/subjects/{old['subject_id']}")
+        nav_index.discard(nav_key(old), question_id)
+        subject_packs.schedule(old["subject_id"])
     request.session["flash"] = "تم حذف السؤال"
     return RedirectResponse(url="/admin", status_code=303)
 
 
 @app.post("/admin/suggestions/{suggestion_id}/publish")
-def admin_publish_suggestion(request: Request, suggestion_id: int, subject_id: int = Form(...), exam_type: str = Form(...)):
-    admin = require_admin(request)
+async def admin_publish_suggestion(request: Request, suggestion_id: int, subject_id: int = Form(...), exam_type: str = Form(...)):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
-    conn = get_db()
-    sug = conn.execute("SELECT * FROM suggestions WHERE id = ?", (suggestion_id,)).fetchone()
-    if not sug:
-        conn.close()
+
+    def publish(conn):
+        sug = conn.execute("SELECT * FROM suggestions WHERE id = ?", (suggestion_id,)).fetchone()
+        if not sug:
+            return None
+        choices = (sug["choice_a"] or "", sug["choice_b"] or "", sug["choice_c"] or "", sug["choice_d"] or "")
+        content_hash = question_content_hash(subject_id, exam_type, "past", sug["question_text"], choices, sug["image_path"])
+        cur = conn.execute(
+            "INSERT INTO questions (subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, image_path, source, explanation, content_hash, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (subject_id, exam_type, sug["question_text"] or "", *choices, sug["proposed_correct_choice"] or "A", sug["image_path"], "past", sug["proposed_explanation"], content_hash, now_iso(), now_iso()),
+        )
+        index_question_signatures(conn, [cur.lastrowid])
+        conn.execute("UPDATE suggestions SET status = 'published' WHERE id = ?", (suggestion_id,))
+        return cur.lastrowid
+
+    try:
+        question_id = await db_write(publish)
+    except sqlite3.IntegrityError as exc:
+        request.session["flash"] = question_save_error(exc, "هذا السؤال موجود مسبقاً في المادة")
+        return RedirectResponse(url="/admin", status_code=303)
+    if question_id is None:
         request.session["flash"] = "الاقتراح غير موجود"
         return RedirectResponse(url="/admin", status_code=303)
-
-    conn.execute(
-        "INSERT INTO questions (subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, image_path, source, explanation, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (subject_id, exam_type, sug["question_text"] or "", sug["choice_a"] or "", sug["choice_b"] or "", sug["choice_c"] or "", sug["choice_d"] or "", sug["proposed_correct_choice"] or "A", sug["image_path"], "past", sug["proposed_explanation"], now_iso(), now_iso()),
-    )
-    conn.execute("UPDATE suggestions SET status = 'published' WHERE id = ?", (suggestion_id,))
-    conn.commit()
-    conn.close()
+    invalidate_question_totals(subject_id)
+    invalidate_pages(f"/subjects/{subject_id}")
+    nav_index.add((subject_id, exam_type, "past"), question_id)
+    subject_packs.schedule(subject_id)
     request.session["flash"] = "تم نشر الاقتراح كسؤال"
     return RedirectResponse(url="/admin", status_code=303)
 
 
 @app.post("/admin/suggestions/{suggestion_id}/reject")
-def admin_reject_suggestion(request: Request, suggestion_id: int):
-    admin = require_admin(request)
+async def admin_reject_suggestion(request: Request, suggestion_id: int):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
-    conn = get_db()
-    conn.execute("DELETE FROM suggestions WHERE id = ?", (suggestion_id,))
-    conn.commit()
-    conn.close()
+    await db_write(lambda conn: conn.execute("DELETE FROM suggestions WHERE id = ?", (suggestion_id,)))
     request.session["flash"] = "تم حذف الاقتراح"
     return RedirectResponse(url="/admin", status_code=303)
 
 
 @app.post("/admin/reports/{report_id}/resolve")
-def admin_resolve_report(request: Request, report_id: int, correct_choice: str = Form(...), explanation: Optional[str] = Form(None)):
-    admin = require_admin(request)
+async def admin_resolve_report(request: Request, report_id: int, correct_choice: str = Form(...), explanation: Optional[str] = Form(None)):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
-    conn = get_db()
-    rep = conn.execute("SELECT * FROM reports WHERE id = ?", (report_id,)).fetchone()
-    if not rep:
-        conn.close()
+
+    def resolve(conn):
+        rep = conn.execute("SELECT * FROM reports WHERE id = ?", (report_id,)).fetchone()
+        if not rep:
+            return None
+        conn.execute("UPDATE questions SET correct_choice = ?, explanation = ?, updated_at = ? WHERE id = ?", (correct_choice, explanation, now_iso(), rep["question_id"]))
+        conn.execute("UPDATE reports SET status = 'resolved' WHERE id = ?", (report_id,))
+        q = conn.execute("SELECT subject_id FROM questions WHERE id = ?", (rep["question_id"],)).fetchone()
+        return q["subject_id"] if q else 0
+
+    subject_id = await db_write(resolve)
+    if subject_id is None:
         request.session["flash"] = "البلاغ غير موجود"
         return RedirectResponse(url="/admin", status_code=303)
-
-    conn.execute("UPDATE questions SET correct_choice = ?, explanation = ?, updated_at = ? WHERE id = ?", (correct_choice, explanation, now_iso(), rep["question_id"]))
-    conn.execute("UPDATE reports SET status = 'resolved' WHERE id = ?", (report_id,))
-    conn.commit()
-    conn.close()
+    if subject_id:
+        invalidate_pages(f"/subjects/{subject_id}")
+        subject_packs.schedule(subject_id)
     request.session["flash"] = "تم تصحيح السؤال وحل البلاغ"
     return RedirectResponse(url="/admin", status_code=303)
 
 
 # ---------- Export / Import ----------
 
+EXPORT_COLUMNS = ["id", "subject", "exam_type", "question_text", "choice_a", "choice_b", "choice_c", "choice_d", "correct_choice", "image_path", "source", "explanation"]
+
+
+def _export_chunks(where: str, params: list, compress: bool):
+    """Yield the CSV export in EXPORT_BATCH_SIZE-row chunks (gzip-framed if asked).
+
+    Runs as a sync generator, which Starlette drives from its threadpool, so
+    only one batch of rows is in memory at a time. A download lasts as long as
+    the client reads it, so it gets its own connection instead of holding one
+    of the DB_READ_POOL_SIZE read connections.
+    """
+    conn = open_connection(DB_PATH, readonly=True)
+    try:
+        cur = conn.execute(
+            "SELECT q.id, s.name AS subject, q.exam_type, q.question_text, q.choice_a, q.choice_b, q.choice_c, q.choice_d, q.correct_choice, q.image_path, q.source, q.explanation "
+            f"FROM questions q JOIN subjects s ON s.id = q.subject_id{where} ORDER BY q.id ASC",
+            params,
+        )
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(EXPORT_COLUMNS)
+        while True:
+            rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+            for r in rows:
+                writer.writerow(list(r))
+            chunk = output.getvalue().encode("utf-8")
+            output.seek(0)
+            output.truncate()
+            if gz is not None:
+                chunk = gz.compress(chunk)
+            if chunk:
+                yield chunk
+            if not rows:
+                break
+        if gz is not None:
+            yield gz.flush()
+    finally:
+        conn.close()
+
+
 @app.get("/admin/export.csv")
-def admin_export_csv(request: Request):
-    admin = require_admin(request)
+@app.get("/admin/export.csv.gz")
+async def admin_export_csv(request: Request, subject_id: str = "", source: str = "", exam: str = ""):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
 
-    conn = get_db()
-    rows = conn.execute(
-        "SELECT q.id, s.name AS subject, q.exam_type, q.question_text, q.choice_a, q.choice_b, q.choice_c, q.choice_d, q.correct_choice, q.image_path, q.source, q.explanation FROM questions q JOIN subjects s ON s.id = q.subject_id ORDER BY q.id ASC"
-    ).fetchall()
-    conn.close()
+    clauses = []
+    params = []
+    if subject_id.isdigit():
+        clauses.append("q.subject_id = ?")
+        params.append(int(subject_id))
+    if source in ("past", "ai"):
+        clauses.append("q.source = ?")
+        params.append(source)
+    if exam in ("mid", "final", "both"):
+        clauses.append("q.exam_type = ?")
+        params.append(exam)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+    compress = request.url.path.endswith(".gz")
+    filename = "questions.csv.gz" if compress else "questions.csv"
+    return StreamingResponse(
+        _export_chunks(where, params, compress),
+        media_type="application/gzip" if compress else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id", "subject", "exam_type", "question_text", "choice_a", "choice_b", "choice_c", "choice_d", "correct_choice", "image_path", "source", "explanation"])
-    for r in rows:
-        writer.writerow([r["id"], r["subject"], r["exam_type"], r["question_text"], r["choice_a"], r["choice_b"], r["choice_c"], r["choice_d"], r["correct_choice"], r["image_path"], r["source"], r["explanation"]])
 
-    output.seek(0)
-    return StreamingResponse(iter([output.getvalue()]), media_type="text/csv", headers={"Content-Disposition": "attachment; filename=questions.csv"})
+class ImportJob:
+    """Progress and outcome of one CSV import, polled via /admin/import/{id}."""
+
+    def __init__(self, filename: str, dry_run: bool = False):
+        self.id = uuid.uuid4().hex
+        self.filename = filename
+        self.dry_run = dry_run
+        self.status = "queued"
+        self.rows = 0
+        self.inserted = 0
+        self.duplicates = 0
+        self.similar = []
+        self.similar_count = 0
+        self.new_subjects = []
+        self.errors = []
+        self.error_count = 0
+        self.message = None
+        self.started_at = now_iso()
+        self.finished_at = None
+        self.task = None
+
+    def reject(self, line: int, message: str):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def flag_similar(self, line: int, match: dict):
+        self.similar_count += 1
+        if len(self.similar) < IMPORT_MAX_ERRORS:
+            self.similar.append({"line": line, "question_id": match["id"], "similarity": round(match["similarity"], 2)})
+
+    def summary(self) -> str:
+        if self.status == "failed":
+            text = f"فشل الاستيراد: {self.message}"
+            if self.inserted:
+                text += f" (بعد استيراد {self.inserted} سؤال)"
+            return text
+        if self.dry_run:
+            text = f"فحص تجريبي: {self.rows - self.error_count} صف صالح، {self.error_count} صف مرفوض، {len(self.new_subjects)} مادة جديدة"
+            if self.similar_count:
+                text += f"، {self.similar_count} صف يشبه أسئلة موجودة"
+        else:
+            text = f"تم استيراد {self.inserted} سؤال"
+            if self.duplicates:
+                text += f"، وتم تخطي {self.duplicates} سؤال مكرر"
+            if self.error_count:
+                text += f"، ورُفض {self.error_count} صف"
+        if self.error_count or self.similar_count:
+            text += f" (التفاصيل: /admin/import/{self.id})"
+        return text
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "dry_run": self.dry_run,
+            "status": self.status,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "duplicates": self.duplicates,
+            "similar_count": self.similar_count,
+            "similar": self.similar,
+            "new_subjects": self.new_subjects,
+            "error_count": self.error_count,
+            "errors": self.errors,
+            "message": self.message,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+_import_jobs: OrderedDict = OrderedDict()
+
+
+def _register_import(job: ImportJob):
+    _import_jobs[job.id] = job
+    for old_id in list(_import_jobs):
+        if len(_import_jobs) <= IMPORT_JOBS_KEPT:
+            break
+        if _import_jobs[old_id].finished_at is not None:
+            del _import_jobs[old_id]
+
+
+def _validate_import_row(row: dict) -> tuple:
+    """Return (subject name, question values) or raise ValueError."""
+    subject = (row.get("subject") or "").strip()
+    if not subject:
+        raise ValueError("اسم المادة مفقود")
+    exam_type = (row.get("exam_type") or "mid").strip()
+    if exam_type not in ("mid", "final", "both"):
+        raise ValueError(f"نوع امتحان غير صالح: {exam_type}")
+    source = (row.get("source") or "past").strip()
+    if source not in ("past", "ai"):
+        raise ValueError(f"مصدر غير صالح: {source}")
+    correct_choice = (row.get("correct_choice") or "A").strip().upper()
+    if correct_choice not in ("A", "B", "C", "D"):
+        raise ValueError(f"إجابة صحيحة غير صالحة: {correct_choice}")
+    choices = [row.get(f"choice_{c}") or "" for c in "abcd"]
+    if not all(c.strip() for c in choices):
+        raise ValueError("الخيارات الأربعة مطلوبة")
+    question_text = row.get("question_text") or ""
+    image_path = row.get("image_path") or None
+    if not question_text.strip() and not image_path:
+        raise ValueError("نص السؤال أو الصورة مطلوب")
+    return subject, (exam_type, question_text, *choices, correct_choice, image_path, source, row.get("explanation") or "")
+
+
+def _read_import_batch(job: ImportJob, reader) -> list:
+    """Parse and validate up to IMPORT_BATCH_SIZE rows; [] once the file is done.
+
+    Runs in the threadpool, so the writer thread only ever sees clean rows.
+    """
+    rows = []
+    for row in reader:
+        job.rows += 1
+        try:
+            name, values = _validate_import_row(row)
+        except ValueError as exc:
+            job.reject(reader.line_num, str(exc))
+            continue
+        rows.append((reader.line_num, name, values))
+        if len(rows) >= IMPORT_BATCH_SIZE:
+            break
+    return rows
+
+
+def _check_import_batch(conn: sqlite3.Connection, job: ImportJob, subjects: dict, rows: list):
+    """Dry run: note new subjects and rows that look like questions already in their subject."""
+    for line, name, values in rows:
+        subject_id = subjects.get(name)
+        if subject_id is None:
+            job.new_subjects.append(name)
+            subjects[name] = subject_id = -len(job.new_subjects)
+        if subject_id > 0:
+            similar = similar_questions(conn, values[1], values[2:6], subject_id)
+            if similar:
+                job.flag_similar(line, similar[0])
+
+
+def _insert_import_batch(conn: sqlite3.Connection, subjects: dict, rows: list) -> tuple:
+    """Insert one batch as its own writer job.
+
+    Rows already in the bank (same content hash) are skipped. Returns
+    (subject ids looked up by name, names of subjects created, [(id,
+    subject_id, question_text, choices)] inserted); the caller records them
+    only once the job has committed.
+    """
+    resolved = {}
+    created = []
+    inserted = []
+    stamp = now_iso()
+    for line, name, values in rows:
+        subject_id = subjects.get(name) or resolved.get(name)
+        if subject_id is None:
+            # another request may have added the subject since the import started
+            if conn.execute("INSERT INTO subjects (name, created_at) VALUES (?, ?) ON CONFLICT(name) DO NOTHING", (name, stamp)).rowcount:
+                created.append(name)
+            subject_id = resolved[name] = conn.execute("SELECT id FROM subjects WHERE name = ?", (name,)).fetchone()["id"]
+        content_hash = question_content_hash(subject_id, values[0], values[8], values[1], values[2:6], values[7])
+        cur = conn.execute(
+            "INSERT INTO questions (subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, image_path, source, explanation, content_hash, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT(content_hash) DO NOTHING",
+            (subject_id, *values, content_hash, stamp, stamp),
+        )
+        if cur.rowcount:
+            inserted.append((cur.lastrowid, subject_id, values[1], values[2:6]))
+    return resolved, created, inserted
+
+
+async def _import_batches(job: ImportJob, stream, touched: set):
+    """Feed the file to the writer one IMPORT_BATCH_SIZE chunk at a time.
+
+    Other writes (answers, admin edits) run between chunks, so a large import
+    never holds the writer for more than one chunk. Each chunk commits on its
+    own; if a chunk fails, the chunks before it stay imported. Near-duplicate
+    signatures are computed here and stored in a separate small job. A dry
+    run only validates (on read connections). Subjects that received
+    questions are added to ``touched`` as each chunk commits.
+    """
+    job.status = "running"
+    subjects = await db_read(lambda conn: {r["name"]: r["id"] for r in conn.execute("SELECT id, name FROM subjects")})
+    reader = csv.DictReader(stream)
+    while True:
+        rows = await run_in_threadpool(_read_import_batch, job, reader)
+        if not rows:
+            return
+        if job.dry_run:
+            await db_read(_check_import_batch, job, subjects, rows)
+            continue
+        resolved, created, inserted = await db_write(_insert_import_batch, subjects, rows)
+        subjects.update(resolved)
+        job.new_subjects += created
+        job.inserted += len(inserted)
+        job.duplicates += len(rows) - len(inserted)
+        touched.update(subject_id for _, subject_id, _, _ in inserted)
+        if inserted:
+            signatures = await run_in_threadpool(signature_rows, [(qid, text, choices) for qid, _, text, choices in inserted])
+            await db_write(store_signatures, signatures)
+
+
+async def _run_import(job: ImportJob, raw, path: Optional[str] = None):
+    stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+    touched = set()
+    try:
+        await _import_batches(job, stream, touched)
+    except Exception as exc:
+        job.status = "failed"
+        job.message = str(exc)
+    else:
+        job.status = "done"
+    finally:
+        if touched:
+            invalidate_question_totals()
+            invalidate_pages("/subjects", *[f"/subjects/{subject_id}" for subject_id in touched])
+            for subject_id in touched:
+                nav_index.drop_subject(subject_id)
+            subject_packs.schedule(*touched)
+        job.finished_at = now_iso()
+        stream.detach()
+        if path is not None:
+            raw.close()
+            os.remove(path)
+
+
+def _spool_upload(file: UploadFile) -> str:
+    """Copy an upload to a temp file that outlives the request."""
+    fd, path = tempfile.mkstemp(prefix="import-", suffix=".csv")
+    with os.fdopen(fd, "wb") as out:
+        file.file.seek(0)
+        shutil.copyfileobj(file.file, out)
+    return path
 
 
 @app.post("/admin/import.csv")
-def admin_import_csv(request: Request, file: UploadFile = File(...)):
-    admin = require_admin(request)
+async def admin_import_csv(request: Request, file: UploadFile = File(...), dry_run: bool = Form(False)):
+    admin = await require_admin(request)
     if isinstance(admin, RedirectResponse):
         return admin
 
-    content = file.file.read().decode("utf-8")
-    reader = csv.DictReader(io.StringIO(content))
-    conn = get_db()
-    for row in reader:
-        subject_name = row.get("subject")
-        if not subject_name:
-            continue
-        subject = conn.execute("SELECT id FROM subjects WHERE name = ?", (subject_name,)).fetchone()
-        if not subject:
-            conn.execute("INSERT INTO subjects (name, created_at) VALUES (?, ?)", (subject_name, now_iso()))
-            subject = conn.execute("SELECT id FROM subjects WHERE name = ?", (subject_name,)).fetchone()
-        conn.execute(
-            "INSERT INTO questions (subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, image_path, source, explanation, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-            (subject["id"], row.get("exam_type", "mid"), row.get("question_text", ""), row.get("choice_a", ""), row.get("choice_b", ""), row.get("choice_c", ""), row.get("choice_d", ""), row.get("correct_choice", "A"), row.get("image_path", None), row.get("source", "past"), row.get("explanation", ""), now_iso(), now_iso()),
-        )
-    conn.commit()
-    conn.close()
-    request.session["flash"] = "تم استيراد الأسئلة"
+    job = ImportJob(file.filename or "import.csv", dry_run)
+    _register_import(job)
+    if file.size is not None and file.size <= IMPORT_INLINE_BYTES:
+        await _run_import(job, file.file)
+        request.session["flash"] = job.summary()
+    else:
+        path = await run_in_threadpool(_spool_upload, file)
+        job.task = asyncio.create_task(_run_import(job, open(path, "rb"), path))
+        request.session["flash"] = f"جاري الاستيراد في الخلفية، تابع التقدم عبر /admin/import/{job.id}"
     return RedirectResponse(url="/admin", status_code=303)
 
 
+@app.get("/admin/import/{job_id}")
+async def admin_import_status(request: Request, job_id: str):
+    admin = await require_admin(request)
+    if isinstance(admin, RedirectResponse):
+        return admin
+    job = _import_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"detail": "not found"}, status_code=404)
+    return JSONResponse(job.as_dict())
+
+
 @app.get("/404", response_class=HTMLResponse)
-def not_found(request: Request):
+async def not_found(request: Request):
     return templates.TemplateResponse("404.html", {"request": request, "flash": request.session.pop("flash", None)})
 
 
@@ -0,0 +1,82 @@
+"""Answer-submission throughput with and without group commit.
+
+Simulates a class answering at once: many students POST
+/questions/{id}/answer concurrently against a copy of app.db.
+
+    python benchmarks/bench_answers.py --students 40 --answers 2000
+"""
+import argparse
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import app as bank  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+
+def prepare(db_path: str, students: int):
+    conn = sqlite3.connect(db_path)
+    now = bank.now_iso()
+    conn.executemany(
+        "INSERT OR IGNORE INTO users (username, full_name, password_hash, role, points, created_at) VALUES (?, ?, 'x', 'user', 0, ?)",
+        [(f"bench_student_{i}", f"Student {i}", now) for i in range(students)],
+    )
+    conn.commit()
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE username LIKE 'bench_student_%' ORDER BY id")]
+    questions = conn.execute("SELECT id, correct_choice FROM questions ORDER BY id").fetchall()
+    conn.close()
+    if not questions:
+        raise SystemExit("app.db has no questions to benchmark against")
+    return user_ids, questions
+
+
+def run(client: TestClient, user_ids, questions, total: int) -> float:
+    cookies = [{bank.SESSION_COOKIE: bank.get_serializer().dumps({"user_id": uid})} for uid in user_ids]
+
+    def answer(i):
+        qid, correct = questions[i % len(questions)]
+        choice = correct if i % 3 else "A"
+        r = client.post(f"/questions/{qid}/answer", data={"choice": choice}, cookies=cookies[i % len(cookies)], follow_redirects=False)
+        assert r.status_code == 303, r.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(user_ids)) as ex:
+        list(ex.map(answer, range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--students", type=int, default=40)
+    parser.add_argument("--answers", type=int, default=2000)
+    parser.add_argument("--db", default=str(ROOT / "app.db"))
+    args = parser.parse_args()
+
+    configs = [
+        ("one commit per answer", 0, 1),
+        (f"group commit ({bank.WRITE_FLUSH_INTERVAL_MS:g} ms / {bank.WRITE_BATCH_SIZE})", bank.WRITE_FLUSH_INTERVAL_MS, bank.WRITE_BATCH_SIZE),
+    ]
+    for label, interval, batch in configs:
+        tmp = tempfile.mkdtemp()
+        bank.DB_PATH = str(Path(tmp) / "app.db")
+        shutil.copy(args.db, bank.DB_PATH)
+        bank.WRITE_FLUSH_INTERVAL_MS = interval
+        bank.WRITE_BATCH_SIZE = batch
+        user_ids, questions = prepare(bank.DB_PATH, args.students)
+        bank.db_writer.batches = bank.db_writer.jobs = 0
+        with TestClient(bank.app) as client:
+            rps = run(client, user_ids, questions, args.answers)
+            per_batch = bank.db_writer.jobs / max(1, bank.db_writer.batches)
+        print(f"{label:<36} {rps:8.1f} answers/s  ({per_batch:.1f} writes per commit)")
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
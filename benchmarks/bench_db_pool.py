@@ -0,0 +1,89 @@
+"""Requests/second for the hot read routes, per-call connections vs the pool.
+
+Runs against a throwaway copy of app.db so the real database is untouched:
+
+    python benchmarks/bench_db_pool.py --requests 2000
+"""
+import argparse
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import app as bank  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+pooled_get_read_db = bank.get_read_db
+
+
+def legacy_get_db():
+    # the pre-pool behaviour: a fresh connection (and PRAGMA) on every call
+    conn = sqlite3.connect(bank.DB_PATH)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    return conn
+
+
+def pick_routes(db_path: str):
+    conn = sqlite3.connect(db_path)
+    q = conn.execute("SELECT id, subject_id, source, exam_type FROM questions ORDER BY id LIMIT 1").fetchone()
+    conn.close()
+    if not q:
+        raise SystemExit("app.db has no questions to benchmark against")
+    qid, subject_id, source, exam = q
+    return [
+        f"/questions/{qid}",
+        f"/questions/{qid}/result",
+        f"/subjects/{subject_id}?source={source}&exam={exam}",
+        "/subjects?source=ai",
+    ]
+
+
+def run(client: TestClient, routes, total: int, workers: int, cookies: dict) -> float:
+    def hit(i):
+        r = client.get(routes[i % len(routes)], cookies=cookies)
+        r.raise_for_status()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(hit, range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--db", default=str(ROOT / "app.db"))
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    db_copy = str(Path(tmp) / "app.db")
+    shutil.copy(args.db, db_copy)
+    bank.DB_PATH = db_copy
+    routes = pick_routes(db_copy)
+    # authenticated traffic exercises get_current_user's extra lookup as well
+    cookies = {bank.SESSION_COOKIE: bank.get_serializer().dumps({"user_id": 1})}
+
+    results = {}
+    for label, getter in (("before (connect per call)", legacy_get_db), ("after (pooled, WAL)", pooled_get_read_db)):
+        bank.get_read_db = getter
+        with TestClient(bank.app) as client:
+            run(client, routes, min(100, args.requests), args.workers, cookies)  # warm-up
+            results[label] = run(client, routes, args.requests, args.workers, cookies)
+
+    for label, rps in results.items():
+        print(f"{label:<28} {rps:8.1f} req/s")
+    before, after = results.values()
+    print(f"{'speed-up':<28} {after / before:8.2f}x")
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
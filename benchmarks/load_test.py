@@ -0,0 +1,199 @@
+"""Per-route latency (p50/p95/p99) and throughput under concurrent load.
+
+Drives the main student and admin flows against a copy of a database
+(build a big one with make_synthetic_db.py) through TestClient, or against
+an already running server with --base-url:
+
+    python benchmarks/load_test.py --db /tmp/bench.db --requests 500 --workers 16
+    python benchmarks/load_test.py --base-url http://127.0.0.1:8000 --db app.db
+
+Requests are chosen from a fixed seed, so two runs against the same
+database issue the same sequence. Sessions are forged with the app's
+serializer, so the server must run with the same SECRET_KEY. The answer and
+import routes write to the database, so point --base-url at a scratch copy.
+"""
+import argparse
+import csv
+import io
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import app as bank  # noqa: E402
+
+IMPORT_ROWS = 50
+
+
+class Scenario:
+    """Picks request targets from the database and issues them."""
+
+    def __init__(self, db_path: str, seed: int):
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        self.questions = conn.execute("SELECT id, subject_id, source, exam_type, correct_choice FROM questions ORDER BY id").fetchall()
+        self.user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'user' ORDER BY id")]
+        self.admin_id = conn.execute("SELECT id FROM users WHERE role = 'admin' ORDER BY id LIMIT 1").fetchone()[0]
+        conn.close()
+        if not self.questions or not self.user_ids:
+            raise SystemExit("the database needs questions and users; see make_synthetic_db.py")
+        self.seed = seed
+
+    def session(self, user_id: int) -> dict:
+        return {bank.SESSION_COOKIE: bank.get_serializer().dumps({"user_id": user_id})}
+
+    def student(self, rng: random.Random) -> dict:
+        return self.session(rng.choice(self.user_ids))
+
+    def question(self, rng: random.Random):
+        return rng.choice(self.questions)
+
+    def import_csv(self, rng: random.Random) -> bytes:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["subject", "exam_type", "question_text", "choice_a", "choice_b", "choice_c", "choice_d", "correct_choice", "source", "explanation"])
+        for i in range(IMPORT_ROWS):
+            writer.writerow(["مادة الحمل", "mid", f"سؤال تجريبي {rng.random()}", "أ", "ب", "ج", "د", "A", "ai", "شرح"])
+        return out.getvalue().encode("utf-8")
+
+
+def subject_view(client, s: Scenario, rng: random.Random):
+    q = s.question(rng)
+    return client.get(f"/subjects/{q['subject_id']}?source={q['source']}&exam={q['exam_type']}", cookies=s.student(rng))
+
+
+def question_view(client, s: Scenario, rng: random.Random):
+    return client.get(f"/questions/{s.question(rng)['id']}", cookies=s.student(rng))
+
+
+def answer_flow(client, s: Scenario, rng: random.Random):
+    q = s.question(rng)
+    cookies = s.student(rng)
+    choice = q["correct_choice"] if rng.random() < 0.6 else rng.choice("ABCD")
+    r = client.post(f"/questions/{q['id']}/answer", data={"choice": choice}, cookies=cookies, follow_redirects=False)
+    if r.status_code != 303:
+        return r
+    return client.get(f"/questions/{q['id']}/result", cookies=cookies)
+
+
+def dashboard(client, s: Scenario, rng: random.Random):
+    # admin-only: a student session would only time the redirect to the home page
+    r = client.get("/dashboard", cookies=s.session(s.admin_id), follow_redirects=False)
+    assert r.status_code == 200, f"/dashboard returned {r.status_code}"
+    return r
+
+
+def export(client, s: Scenario, rng: random.Random):
+    return client.get(f"/admin/export.csv?subject_id={s.question(rng)['subject_id']}", cookies=s.session(s.admin_id))
+
+
+def import_(client, s: Scenario, rng: random.Random):
+    return client.post(
+        "/admin/import.csv",
+        files={"file": ("load.csv", s.import_csv(rng), "text/csv")},
+        cookies=s.session(s.admin_id),
+        follow_redirects=False,
+    )
+
+
+ROUTES = {
+    "subject_view": subject_view,
+    "question_view": question_view,
+    "answer+result": answer_flow,
+    "dashboard": dashboard,
+    "export": export,
+    "import": import_,
+}
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_route(client, scenario: Scenario, name: str, total: int, workers: int) -> dict:
+    latencies = []
+    errors = 0
+
+    def hit(i):
+        nonlocal errors
+        # one generator per request, so the sequence does not depend on thread scheduling
+        rng = random.Random(f"{scenario.seed}:{name}:{i}")
+        start = time.perf_counter()
+        r = ROUTES[name](client, scenario, rng)
+        elapsed = time.perf_counter() - start
+        if r.status_code >= 400:
+            errors += 1
+        latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(hit, range(total)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "rps": total / wall,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+    }
+
+
+def report(results: dict):
+    print(f"{'route':<16} {'reqs':>6} {'err':>4} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['requests']:>6} {r['errors']:>4} {r['rps']:>9.1f} {r['p50']:>9.1f} {r['p95']:>9.1f} {r['p99']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=str(ROOT / "app.db"), help="database to copy (or the one the --base-url server uses)")
+    parser.add_argument("--base-url", help="load a running server instead of an in-process TestClient")
+    parser.add_argument("--requests", type=int, default=300, help="requests per route")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--routes", default=",".join(ROUTES), help="comma-separated subset of: " + ", ".join(ROUTES))
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    routes = [name.strip() for name in args.routes.split(",") if name.strip()]
+    unknown = [name for name in routes if name not in ROUTES]
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(unknown)}")
+
+    results = {}
+    if args.base_url:
+        import httpx
+
+        scenario = Scenario(args.db, args.seed)
+        with httpx.Client(base_url=args.base_url, timeout=60) as client:
+            for name in routes:
+                results[name] = run_route(client, scenario, name, args.requests, args.workers)
+    else:
+        from fastapi.testclient import TestClient
+
+        tmp = tempfile.mkdtemp()
+        try:
+            bank.DB_PATH = str(Path(tmp) / "app.db")
+            shutil.copy(args.db, bank.DB_PATH)
+            scenario = Scenario(bank.DB_PATH, args.seed)
+            with TestClient(bank.app) as client:
+                for name in routes:
+                    results[name] = run_route(client, scenario, name, args.requests, args.workers)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Build a synthetic app.db of any size for benchmarks and load tests.
+
+The schema comes from init_db(), so indexes, triggers, the search and
+near-duplicate indexes and the admin counters are the same as in
+production. Content is generated from a fixed seed, so the same arguments
+always produce the same database:
+
+    python benchmarks/make_synthetic_db.py --out /tmp/bench.db \
+        --subjects 20 --questions 50000 --users 5000 --attempts 2000000
+
+Every generated user's password is "bench"; the admin is the default one
+init_db() creates.
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import app as bank  # noqa: E402
+
+BATCH = 10000
+AR_WORDS = (
+    "البرمجة الدالة المتغير القائمة الحلقة الشرط الكائن الصنف الوراثة الاستثناء الملف "
+    "القاموس المجموعة الخوارزمية التعقيد الفرز البحث الشجرة الرسم المصفوفة المؤشر الذاكرة "
+    "قاعدة البيانات الاستعلام الفهرس المعاملة الشبكة البروتوكول الخادم العميل"
+).split()
+EN_WORDS = (
+    "python function variable list loop condition object class inheritance exception file "
+    "dictionary set algorithm complexity sort search tree graph array pointer memory "
+    "database query index transaction network protocol server client"
+).split()
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    pool = AR_WORDS if rng.random() < 0.6 else EN_WORDS
+    return " ".join(rng.choice(pool) for _ in range(words))
+
+
+def paragraph(rng: random.Random, sentences: int) -> str:
+    return ". ".join(sentence(rng, rng.randint(8, 20)) for _ in range(sentences)) + "."
+
+
+def timestamps(rng: random.Random, start: datetime, days: int):
+    span = days * 86400
+    while True:
+        yield (start + timedelta(seconds=rng.randrange(span))).isoformat()
+
+
+def chunks(rows, size: int = BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(conn: sqlite3.Connection, args, rng: random.Random):
+    start = datetime(2025, 9, 1)
+    when = timestamps(rng, start, args.days)
+    password_hash = bank.hash_password("bench")
+
+    conn.executemany(
+        "INSERT INTO subjects (name, created_at) VALUES (?, ?)",
+        [(f"مادة {i + 1} {rng.choice(EN_WORDS)}", start.isoformat()) for i in range(args.subjects)],
+    )
+    subject_ids = [row[0] for row in conn.execute("SELECT id FROM subjects ORDER BY id")]
+
+    def questions():
+        for _ in range(args.questions):
+            created = next(when)
+            yield (
+                rng.choice(subject_ids),
+                rng.choice(("mid", "final", "both")),
+                sentence(rng, rng.randint(10, 40)) + "؟",
+                *(sentence(rng, rng.randint(2, 8)) for _ in range(4)),
+                rng.choice("ABCD"),
+                rng.choice(("past", "ai")),
+                paragraph(rng, rng.randint(1, args.explanation_sentences)),
+                created,
+                created,
+            )
+
+    for batch in chunks(questions()):
+        conn.executemany(
+            "INSERT INTO questions (subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, source, explanation, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            batch,
+        )
+    answers = dict(conn.execute("SELECT id, correct_choice FROM questions"))
+    question_ids = list(answers)
+
+    users = [(f"bench_user_{i}", f"طالب {i}", password_hash, "user", 0, next(when)) for i in range(args.users)]
+    for batch in chunks(users):
+        conn.executemany("INSERT INTO users (username, full_name, password_hash, role, points, created_at) VALUES (?, ?, ?, ?, ?, ?)", batch)
+    user_ids = [row[0] for row in conn.execute("SELECT id FROM users WHERE role = 'user' ORDER BY id")]
+
+    def attempts():
+        # a few heavy users and many light ones, like a real class
+        for _ in range(args.attempts):
+            user_id = user_ids[min(int(rng.paretovariate(1.2)) - 1, len(user_ids) - 1)] if rng.random() < 0.5 else rng.choice(user_ids)
+            question_id = rng.choice(question_ids)
+            correct = rng.random() < 0.65
+            choice = answers[question_id] if correct else rng.choice("ABCD")
+            yield (user_id, question_id, choice, int(choice == answers[question_id]), next(when))
+
+    for batch in chunks(attempts()):
+        conn.executemany("INSERT INTO attempts (user_id, question_id, chosen_choice, is_correct, created_at) VALUES (?, ?, ?, ?, ?)", batch)
+    conn.execute(
+        "UPDATE users SET points = (SELECT COUNT(DISTINCT question_id) FROM attempts WHERE attempts.user_id = users.id AND is_correct = 1) WHERE role = 'user'"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--out", required=True, help="path of the database to create (must not exist)")
+    parser.add_argument("--subjects", type=int, default=10)
+    parser.add_argument("--questions", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--attempts", type=int, default=200000)
+    parser.add_argument("--explanation-sentences", type=int, default=12, help="upper bound; explanations get 1..N sentences")
+    parser.add_argument("--days", type=int, default=120, help="spread created_at over this many days")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    if out.exists():
+        raise SystemExit(f"{out} already exists")
+    bank.DB_PATH = str(out)
+    bank.init_db()
+    bank.close_pools()
+
+    started = time.perf_counter()
+    conn = sqlite3.connect(out)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA foreign_keys = ON")
+    with conn:
+        generate(conn, args, random.Random(args.seed))
+        conn.row_factory = sqlite3.Row
+        bank.index_question_signatures(conn)
+    conn.execute("PRAGMA optimize")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("subjects", "questions", "users", "attempts")}
+    conn.close()
+    print(f"{out}: " + ", ".join(f"{n} {t}" for t, n in counts.items()) + f" in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Query-plan regression check for the SQL in app.py.
+
+Collects every SQL string literal in app.py, builds a fresh database with
+init_db() (so all indexes exist) and runs EXPLAIN QUERY PLAN on each one.
+Exits non-zero if a statement falls back to a full table scan, or sorts
+in a temp B-tree although it has a LIMIT (an index should supply the
+order so the scan can stop early), unless the exact statement is listed
+in ALLOWED_PLANS.
+
+    python check_query_plans.py
+"""
+import ast
+import itertools
+import re
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+sys.path.insert(0, str(ROOT))
+
+import app as bank  # noqa: E402
+
+SQL_START = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+TRIGGER_REF = re.compile(r"\b(new|old)\.\w+")
+FULL_SCAN = re.compile(r"^SCAN (\w+)(?! USING (COVERING )?INDEX)( AS \w+)?$")
+TEMP_SORT = re.compile(r"^USE TEMP B-TREE FOR (.* )?ORDER BY$")
+HAS_LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+
+EXPORT_COLUMNS = "q.id, s.name AS subject, q.exam_type, q.question_text, q.choice_a, q.choice_b, q.choice_c, q.choice_d, q.correct_choice, q.image_path, q.source, q.explanation"
+ADMIN_QUESTIONS_SQL = "SELECT q.*, s.name AS subject_name FROM questions q JOIN subjects s ON s.id = q.subject_id{} ORDER BY q.id DESC LIMIT ?"
+EXPORT_SQL = f"SELECT {EXPORT_COLUMNS} FROM questions q JOIN subjects s ON s.id = q.subject_id{{}} ORDER BY q.id ASC"
+
+
+def filter_shapes(*extra: str) -> list:
+    """Every WHERE clause admin_tab / admin_export_csv can assemble, in the order they add filters."""
+    filters = ("q.subject_id = ?", "q.source = ?", "q.exam_type = ?", *extra)
+    shapes = []
+    for enabled in itertools.product((False, True), repeat=len(filters)):
+        clauses = [clause for on, clause in zip(enabled, filters) if on]
+        shapes.append(f" WHERE {' AND '.join(clauses)}" if clauses else "")
+    return shapes
+
+
+ADMIN_QUESTIONS_SHAPES = [
+    ADMIN_QUESTIONS_SQL.format(where)
+    for where in filter_shapes("q.id IN (SELECT rowid FROM questions_fts WHERE questions_fts MATCH ?)", "q.id < ?")
+]
+EXPORT_SHAPES = [EXPORT_SQL.format(where) for where in filter_shapes()]
+
+# Statements that read a whole table (or sort) on purpose, keyed by the exact
+# statement with whitespace collapsed. Entries that no longer match any
+# statement are reported too, so the list cannot drift into a wildcard.
+ALLOWED_PLANS = {
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'questions_fts'": "schema lookup at startup",
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'counters'": "schema lookup at startup",
+    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'solved_questions'": "schema lookup at startup",
+    "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_questions_content_hash'": "schema lookup at startup",
+    "UPDATE questions SET content_hash = NULL": "one-time rehash when the content hash gained exam type and source",
+    "SELECT id, username, full_name, points, created_at FROM users WHERE role != 'admin'": "leaderboard is loaded into memory once per TTL",
+    "SELECT id, question_text, choice_a, choice_b, choice_c, choice_d FROM questions "
+    "WHERE NOT EXISTS (SELECT 1 FROM question_signatures s WHERE s.question_id = questions.id)": "near-duplicate backfill; one primary key probe per question",
+    ADMIN_QUESTIONS_SQL.format(""): "first admin page: walks the rowid backwards and stops after LIMIT",
+    "SELECT * FROM suggestions ORDER BY id DESC LIMIT ?": "first admin page: walks the rowid backwards and stops after LIMIT",
+    "SELECT r.*, q.question_text FROM reports r JOIN questions q ON q.id = r.question_id ORDER BY r.id DESC LIMIT ?": "first admin page: walks the rowid backwards and stops after LIMIT",
+    EXPORT_SQL.format(""): "unfiltered CSV export walks the whole bank",
+}
+# source and exam_type hold two or three values each, so filtering on them
+# alone keeps a large share of the bank: the admin list walks the rowid newest
+# first and stops after LIMIT (its later pages already plan as a rowid range),
+# and the export reads that share anyway. Indexes for these two admin-only
+# screens would cost every question write.
+for where in filter_shapes():
+    if where and "subject_id" not in where:
+        ALLOWED_PLANS[ADMIN_QUESTIONS_SQL.format(where)] = "admin list filtered by source/exam only: rowid walk that stops after LIMIT"
+        ALLOWED_PLANS[EXPORT_SQL.format(where)] = "export filtered by source/exam only reads a large share of the bank"
+
+# subject_view, question_total, admin_tab, the exam pages, the API, the pack builder, the near-duplicate index and the attempt archiver assemble their WHERE clause at runtime, so list the shapes they produce.
+DYNAMIC_SQL = [
+    "SELECT COUNT(*) FROM questions WHERE subject_id = ? AND source = ? AND exam_type = ?",
+    "SELECT * FROM questions WHERE subject_id = ? AND source = ? ORDER BY id DESC LIMIT ?",
+    "SELECT * FROM questions WHERE subject_id = ? AND source = ? AND id < ? ORDER BY id DESC LIMIT ?",
+    "SELECT * FROM questions WHERE subject_id = ? AND source = ? AND id > ? ORDER BY id ASC LIMIT ?",
+    "SELECT * FROM questions WHERE subject_id = ? AND exam_type = ? AND source = ? ORDER BY id DESC LIMIT ?",
+    "SELECT * FROM questions WHERE subject_id = ? AND exam_type = ? AND source = ? AND id < ? ORDER BY id DESC LIMIT ?",
+    "SELECT * FROM questions WHERE subject_id = ? AND exam_type = ? AND source = ? AND id > ? ORDER BY id ASC LIMIT ?",
+    "SELECT COUNT(*) FROM questions_fts JOIN questions ON questions.id = questions_fts.rowid"
+    " WHERE questions_fts MATCH ? AND subject_id = ? AND exam_type = ? AND source = ?",
+    "SELECT questions.* FROM questions_fts JOIN questions ON questions.id = questions_fts.rowid"
+    " WHERE questions_fts MATCH ? AND subject_id = ? AND source = ?"
+    " ORDER BY questions_fts.rank LIMIT ? OFFSET ?",
+    "SELECT * FROM suggestions WHERE id < ? ORDER BY id DESC LIMIT ?",
+    "SELECT * FROM suggestions ORDER BY id DESC LIMIT ?",
+    "SELECT r.*, q.question_text FROM reports r JOIN questions q ON q.id = r.question_id ORDER BY r.id DESC LIMIT ?",
+    *ADMIN_QUESTIONS_SHAPES,
+    *EXPORT_SHAPES,
+    "SELECT * FROM questions WHERE id IN (?, ?)",
+    f"SELECT {bank.API_QUESTION_COLUMNS} FROM questions WHERE subject_id = ? AND source = ? AND exam_type = ? AND id > ? ORDER BY id LIMIT ?",
+    f"SELECT {bank.API_QUESTION_COLUMNS} FROM questions WHERE subject_id = ? AND id > ? ORDER BY id LIMIT ?",
+    f"SELECT {bank.API_QUESTION_COLUMNS} FROM questions WHERE subject_id = ? AND source = ? AND id > ? ORDER BY id LIMIT ?",
+    f"SELECT {bank.API_QUESTION_COLUMNS} FROM questions WHERE subject_id = ? AND exam_type = ? AND id > ? ORDER BY id LIMIT ?",
+    f"SELECT {bank.API_QUESTION_COLUMNS} FROM questions WHERE subject_id = ? AND updated_at > ? ORDER BY updated_at, id",
+    f"SELECT {bank.API_QUESTION_COLUMNS} FROM questions WHERE subject_id = ? ORDER BY id",
+    "SELECT question_id FROM solved_questions WHERE user_id = ? AND question_id IN (?, ?)",
+    "DELETE FROM main.attempts WHERE id IN (SELECT id FROM main.attempts WHERE created_at < ? ORDER BY created_at, id LIMIT ?)",
+    "SELECT r.*, q.question_text FROM reports r JOIN questions q ON q.id = r.question_id WHERE r.id < ? ORDER BY r.id DESC LIMIT ?",
+    "SELECT id, question_text, choice_a, choice_b, choice_c, choice_d FROM questions WHERE id IN (?)",
+    "SELECT q.id, q.subject_id, q.question_text, q.choice_a, q.choice_b, q.choice_c, q.choice_d, s.signature FROM questions q"
+    " JOIN question_signatures s ON s.question_id = q.id WHERE q.id IN (?, ?)",
+]
+
+
+def collect_sql(path: Path):
+    tree = ast.parse(path.read_text(encoding="utf-8-sig"))
+    skipped = {id(part) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr) for part in node.values}
+    skipped |= {id(node.value) for node in ast.walk(tree) if isinstance(node, ast.Expr)}  # docstrings
+    found = []
+    for node in ast.walk(tree):
+        if id(node) in skipped:
+            continue
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and SQL_START.match(node.value):
+            if TRIGGER_REF.search(node.value):
+                continue  # trigger body, planned as part of the statement that fires it
+            found.append((node.lineno, " ".join(node.value.split())))
+    return found + [(0, sql) for sql in DYNAMIC_SQL]
+
+
+def plan_problems(conn: sqlite3.Connection, sql: str):
+    params = (None,) * sql.count("?")
+    details = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+    problems = [d for d in details if FULL_SCAN.match(d)]
+    if HAS_LIMIT.search(sql):
+        problems += [d for d in details if TEMP_SORT.match(d)]
+    return problems
+
+
+def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        bank.DB_PATH = str(Path(tmp) / "plan.db")
+        bank.init_db()
+        conn = sqlite3.connect(bank.DB_PATH)
+        failures = 0
+        seen = set()
+        for lineno, sql in collect_sql(ROOT / "app.py"):
+            seen.add(sql)
+            try:
+                problems = plan_problems(conn, sql)
+            except sqlite3.Error as exc:
+                print(f"app.py:{lineno}: cannot plan ({exc}): {sql}")
+                failures += 1
+                continue
+            if problems and sql not in ALLOWED_PLANS:
+                print(f"app.py:{lineno}: {', '.join(problems)}\n    {sql}")
+                failures += 1
+        for sql in ALLOWED_PLANS.keys() - seen:
+            print(f"ALLOWED_PLANS entry matches no statement: {sql}")
+            failures += 1
+        conn.close()
+        bank.get_pool().close_all()
+    if failures:
+        print(f"{failures} statement(s) scan a whole table, sort a LIMIT query or are stale allowances")
+        return 1
+    print("all query plans use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
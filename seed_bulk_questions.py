@@ -1,7 +0,0 @@
-﻿import sqlite3
-from datetime import datetime
-
-DB = "app.db"
-subject_name = "بايثون"
-
-questions = []
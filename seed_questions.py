@@ -0,0 +1,255 @@
+"""Load questions into the bank from JSON, JSONL, CSV or python_questions.txt.
+
+    python seed_questions.py seeds/python_ai.jsonl
+    python seed_questions.py python_questions.txt --subject بايثون --source ai --exam mid
+    python seed_questions.py export.csv --db /tmp/copy.db --dry-run
+
+Records are read as a stream and matched on questions.content_hash (subject,
+exam type, source, question text, choices and image), so running a seed again
+updates answers and explanations in place instead of adding duplicates. Everything is
+written in one transaction; new questions are added to the search index in
+one pass at the end, and each batch's new or rewritten questions to the
+near-duplicate index. Fields a file does not carry (subject, exam
+type, source) come from the command-line defaults.
+
+Accepted fields: subject, exam_type (exam), source, question_text (question,
+q), choices (a list) or choice_a..choice_d, correct_choice (correct,
+answer), explanation (ex), image_path. CSV files use the admin export
+columns.
+"""
+import argparse
+import ast
+import csv
+import json
+import sqlite3
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import app as bank
+
+BATCH_SIZE = 1000
+
+UPSERT_SQL = """
+    INSERT INTO questions (subject_id, exam_type, question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, image_path, source, explanation, content_hash, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(content_hash) DO UPDATE SET
+        question_text = excluded.question_text,
+        choice_a = excluded.choice_a, choice_b = excluded.choice_b, choice_c = excluded.choice_c, choice_d = excluded.choice_d,
+        correct_choice = excluded.correct_choice, explanation = excluded.explanation,
+        updated_at = excluded.updated_at
+    WHERE questions.question_text IS NOT excluded.question_text
+        OR questions.choice_a IS NOT excluded.choice_a OR questions.choice_b IS NOT excluded.choice_b
+        OR questions.choice_c IS NOT excluded.choice_c OR questions.choice_d IS NOT excluded.choice_d
+        OR questions.correct_choice IS NOT excluded.correct_choice
+        OR questions.explanation IS NOT excluded.explanation
+"""
+
+
+# ---------- Readers ----------
+
+def read_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_json(f):
+    # a JSON array has to be parsed whole; use JSONL for very large files
+    data = json.load(f)
+    yield from data.get("questions", []) if isinstance(data, dict) else data
+
+
+def read_csv(f):
+    yield from csv.DictReader(f)
+
+
+def read_python_questions(f):
+    """Items of the ``questions = [{...}, ...]`` list in python_questions.txt.
+
+    The file is a diff of a seed script, so the leading ``+`` of each line is
+    dropped. Items are parsed one ``    {`` ... ``    },`` block at a time.
+    """
+    block = None
+    for line in f:
+        line = line.rstrip("\r\n")
+        if line.startswith("+"):
+            line = line[1:]
+        if block is None:
+            if line == "    {":
+                block = [line]
+            continue
+        block.append(line)
+        if line in ("    },", "    }"):
+            yield ast.literal_eval("\n".join(block).rstrip(","))
+            block = None
+
+
+READERS = {".jsonl": read_jsonl, ".json": read_json, ".csv": read_csv, ".txt": read_python_questions}
+
+
+# ---------- Loading ----------
+
+def normalize(record: dict, defaults: dict) -> tuple:
+    """Return (subject name, question values) or raise ValueError."""
+    def field(*names):
+        for name in names:
+            value = record.get(name)
+            if value not in (None, ""):
+                return value
+        return None
+
+    subject = bank.clean_text(field("subject") or defaults["subject"])
+    if not subject:
+        raise ValueError("missing subject (pass --subject)")
+    exam_type = (field("exam_type", "exam") or defaults["exam"]).strip()
+    if exam_type not in ("mid", "final", "both"):
+        raise ValueError(f"invalid exam type: {exam_type}")
+    source = (field("source") or defaults["source"]).strip()
+    if source not in ("past", "ai"):
+        raise ValueError(f"invalid source: {source}")
+    choices = field("choices") or [field(f"choice_{c}") for c in "abcd"]
+    choices = [bank.clean_text(c) for c in choices]
+    if len(choices) != 4 or not all(choices):
+        raise ValueError("four choices are required")
+    correct_choice = str(field("correct_choice", "correct", "answer") or "").strip().upper()
+    if correct_choice not in ("A", "B", "C", "D"):
+        raise ValueError(f"invalid correct choice: {correct_choice!r}")
+    question_text = bank.clean_text(field("question_text", "question", "q"))
+    image_path = field("image_path")
+    if not question_text and not image_path:
+        raise ValueError("question text or image is required")
+    explanation = bank.clean_text(field("explanation", "ex")) or None
+    return subject, (exam_type, question_text, *choices, correct_choice, image_path, source, explanation)
+
+
+def load(conn: sqlite3.Connection, records, defaults: dict) -> Counter:
+    counts = Counter()
+    subjects = {row["name"]: row["id"] for row in conn.execute("SELECT id, name FROM subjects")}
+    seen = set()
+    batch = []
+
+    def write(rows):
+        hashes = [row[11] for _, row in rows]
+        # the columns UPSERT_SQL compares, to tell updated rows from unchanged ones
+        stored = {
+            r[0]: tuple(r[1:])
+            for r in conn.execute(
+                "SELECT content_hash, question_text, choice_a, choice_b, choice_c, choice_d, correct_choice, explanation "
+                f"FROM questions WHERE content_hash IN ({', '.join('?' * len(hashes))})",
+                hashes,
+            )
+        }
+        pending = rows
+        while pending:
+            fed = 0
+
+            def feed():
+                nonlocal fed
+                for _, row in pending:
+                    fed += 1
+                    yield row
+
+            try:
+                conn.executemany(UPSERT_SQL, feed())
+                written, pending = pending, []
+            except sqlite3.IntegrityError as exc:
+                # a CHECK or FK the live schema enforces: only the failing row is undone,
+                # so skip it and carry on after it
+                n, _ = pending[fed - 1]
+                counts["invalid"] += 1
+                print(f"record {n}: {exc}", file=sys.stderr)
+                written, pending = pending[:fed - 1], pending[fed:]
+            for _, row in written:
+                old = stored.get(row[11])
+                if old is None:
+                    counts["inserted"] += 1
+                elif old != (*row[2:8], row[10]):
+                    counts["updated"] += 1
+                else:
+                    counts["unchanged"] += 1
+        # new rows, and rows whose rewritten text dropped their signature (near_duplicates_au)
+        missing = conn.execute(
+            f"SELECT id FROM questions WHERE content_hash IN ({', '.join('?' * len(hashes))}) "
+            "AND NOT EXISTS (SELECT 1 FROM question_signatures s WHERE s.question_id = questions.id)",
+            hashes,
+        ).fetchall()
+        if missing:
+            bank.index_question_signatures(conn, [row[0] for row in missing])
+
+    def flush():
+        write(batch)
+        batch.clear()
+
+    for n, record in enumerate(records, start=1):
+        try:
+            name, values = normalize(record, defaults)
+        except (ValueError, TypeError, AttributeError) as exc:
+            counts["invalid"] += 1
+            print(f"record {n}: {exc}", file=sys.stderr)
+            continue
+        subject_id = subjects.get(name)
+        if subject_id is None:
+            subject_id = subjects[name] = conn.execute("INSERT INTO subjects (name, created_at) VALUES (?, ?)", (name, bank.now_iso())).lastrowid
+            counts["new subjects"] += 1
+        content_hash = bank.question_content_hash(subject_id, values[0], values[8], values[1], values[2:6], values[7])
+        if content_hash in seen:
+            counts["duplicate in file"] += 1
+            continue
+        seen.add(content_hash)
+        stamp = bank.now_iso()
+        batch.append((n, (subject_id, *values, content_hash, stamp, stamp)))
+        if len(batch) >= BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument("--db", default=bank.DB_PATH)
+    parser.add_argument("--format", choices=sorted(r.lstrip(".") for r in READERS), help="default: from the file extension")
+    parser.add_argument("--subject", default="", help="subject for records without one")
+    parser.add_argument("--exam", default="mid", help="exam type for records without one (older databases do not accept both)")
+    parser.add_argument("--source", default="ai", help="source for records without one")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, then roll back")
+    args = parser.parse_args()
+    for path in args.files:
+        if not args.format and path.suffix.lower() not in READERS:
+            parser.error(f"{path}: unknown extension, pass --format")
+
+    bank.DB_PATH = args.db
+    bank.init_db()
+    bank.close_pools()
+    defaults = {"subject": args.subject, "exam": args.exam, "source": args.source}
+
+    started = time.perf_counter()
+    conn = bank.open_connection(args.db)
+    conn.isolation_level = None
+    conn.execute("BEGIN IMMEDIATE")
+    counts = Counter()
+    try:
+        # index new rows in one pass at the end instead of through the per-row trigger
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM questions").fetchone()[0]
+        conn.execute("DROP TRIGGER IF EXISTS questions_fts_ai")
+        for path in args.files:
+            reader = READERS[f".{args.format}" if args.format else path.suffix.lower()]
+            with path.open(encoding="utf-8-sig", newline="") as f:
+                counts += load(conn, reader(f), defaults)
+        bank.index_questions_after(conn, last_id)
+        bank.ensure_search_triggers(conn)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("ROLLBACK" if args.dry_run else "COMMIT")
+    conn.close()
+
+    summary = ", ".join(f"{counts[k]} {k}" for k in ("inserted", "updated", "unchanged", "duplicate in file", "invalid", "new subjects"))
+    print(f"{'dry run: ' if args.dry_run else ''}{summary} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()